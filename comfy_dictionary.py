@@ -1,20 +1,36 @@
 import argparse
+import asyncio
 import base64
+import collections
+import concurrent.futures
 import ctypes
+import ctypes.util
+import gzip
 import hashlib
+import html
+import heapq
 import inspect
 import io
 import json
 import logging
+import multiprocessing
 import os
 import re
+import select
+import shlex
 import shutil
+import sqlite3
+import struct
 import sys
 import tempfile
+import threading
+import time
 import traceback
 import urllib
+import zlib
 from datetime import datetime
-from PIL import Image
+from email.utils import formatdate
+from PIL import Image, features
 
 import importlib
 import requests
@@ -40,20 +56,83 @@ UPDATE_PLIST = False
 
 # GENERAL GLOBALS
 ALLOWED_EXTENSIONS = [".png", ".jpg", ".jpeg", ".gif", ".webp"]
+CATALOG_FILE = os.path.join(ROOT, 'explorer_catalog.db')
+CATALOG_INTERVAL = 600
+CATALOG_SCHEMA_VERSION = 4
 CP_FILE = os.path.join(ROOT, 'web'+os.sep+'extensions'+os.sep+'core'+os.sep+'colorPalette.js')
 DB_CACHED = False
+DB_FILE = os.path.join(ROOT, 'explorer_dictionary.json')
+FETCH_META_FILE = os.path.join(ROOT, 'explorer_downloads.json')
+GALLERY_BATCH_LIMIT = 1000
+GALLERY_BATCH_SIZE = 100
+GALLERY_BATCH_THRESHOLD = 60
+GALLERY_LISTING_CACHE_ENTRIES = 256
+GALLERY_LISTING_REVALIDATE = 10
+GALLERY_PAGE_SIZE = 500
+GALLERY_SEARCH_LIMIT = 1000
 IMAGE_PATHS = [
     os.path.join(ROOT, "output"),
     os.path.join(ROOT, "input")
 ]
+NODE_CLASS_MAPPINGS_CATEGORIZED = {}
+NODE_MAP = 'https://raw.githubusercontent.com/ltdrdata/ComfyUI-Manager/main/extension-node-map.json'
+NODE_MAP_FILE = (
+    os.path.join(os.path.join(ROOT, 'custom_nodes' + os.sep + 'ComfyUI-Manager'), 'extension-node-map.json')
+    if os.path.exists(os.path.join(os.path.join(ROOT, 'custom_nodes' + os.sep + 'ComfyUI-Manager'), 'extension-node-map.json'))
+    else os.path.join(ROOT, 'extension-node-map.json')
+)
+NODE_PACKAGE_PATHS = {}
 PFILE = (
     os.path.join(os.path.join(ROOT, 'custom_nodes' + os.sep + 'ComfyUI-Manager'), 'custom-node-list.json')
     if os.path.exists(os.path.join(os.path.join(ROOT, 'custom_nodes' + os.sep + 'ComfyUI-Manager'), 'custom-node-list.json'))
     else os.path.join(ROOT, 'custom-node-list.json')
 )
 PLIST = 'https://raw.githubusercontent.com/ltdrdata/ComfyUI-Manager/main/custom-node-list.json'
+PLIST_INTERVAL = 86400
+PLIST_TIMEOUT = 30
+SEARCH_CHUNK = 64
+SEARCH_WORKERS = min(16, (os.cpu_count() or 1) * 2)
+THUMBNAIL_CACHE_MAX_BYTES = 1024 * 1024 * 1024
+THUMBNAIL_CACHE_MAX_ENTRIES = 100000
+THUMBNAIL_AVIF = False
+THUMBNAIL_CACHE_CONTROL = "public, max-age=86400"
+THUMBNAIL_CACHE_CONTROL_VERSIONED = "public, max-age=31536000, immutable"
 THUMBNAIL_DIRECTORY = os.path.join(ROOT, "temp")
+THUMBNAIL_PREFETCH_LIMIT = 10000
+THUMBNAIL_PREFETCH_SUBFOLDERS = 2
+THUMBNAIL_WARM_COUNT = 0
+THUMBNAIL_MEMORY_MB = 64
+THUMBNAIL_STAT_TTL = 5
+THUMBNAIL_FORMATS = {
+    "jpeg": ("JPEG", "image/jpeg", {"quality": 90}),
+    "webp": ("WEBP", "image/webp", {"quality": 80, "method": 4}),
+    "avif": ("AVIF", "image/avif", {"quality": 60, "speed": 8}),
+}
+THUMBNAIL_SIZES = {
+    "grid": (200, 400),
+    "preview": (512, 512),
+    "modal": (1280, 1280),
+}
+THUMBNAIL_WORKERS = os.cpu_count() or 1
 TITLE = "ComfyUI Node Dictionary"
+SEARCH_ALIASES = {
+    "ckpt": ["ckpt_name"],
+    "checkpoint": ["ckpt_name"],
+    "model": ["ckpt_name", "unet_name", "model_name"],
+    "lora": ["lora_name"],
+    "vae": ["vae_name"],
+    "clip": ["clip_name", "clip_name1", "clip_name2"],
+    "sampler": ["sampler_name"],
+    "seed": ["seed", "noise_seed"],
+}
+SEARCH_NODE_KEYS = ["node", "type", "class"]
+SEARCH_VALUE_MAX = 256
+SEARCH_PROMPT_INPUTS = ["text", "text_g", "text_l", "prompt", "positive", "negative", "wildcard_text", "populated_text"]
+SEARCH_SNIPPET_TOKENS = 16
+VIRTUAL_NODE_TYPES = ["Reroute", "Note", "MarkdownNote", "PrimitiveNode"]
+WATCH_DEBOUNCE = 0.5
+WATCH_INTERVAL = 2
+WATCH_MODE = "auto"
 
 
 # FUNCTIONS
@@ -110,13 +189,17 @@ def is_service_online(url='https://google.com/'):
         pass
     return False
 
-def get_full_path(category, path):
-    full_path = None
+def resolve_image_path(category, path):
     for base_path in IMAGE_PATHS:
         if os.path.basename(base_path) == category:
-            base_folder = base_path
-            full_path = os.path.join(base_folder, path)
+            full_path = os.path.abspath(os.path.join(base_path, path))
+            if full_path == os.path.abspath(base_path) or full_path.startswith(os.path.join(os.path.abspath(base_path), '')):
+                return full_path
             break
+    return None
+
+def get_full_path(category, path):
+    full_path = resolve_image_path(category, path)
     
     if not full_path:
         cstr(f"Unable to determine image path from category `{category}` and path `{path}`").error.print()
@@ -133,24 +216,949 @@ def packages(versions=False):
     import subprocess
     return [( r.decode().split('==')[0] if not versions else r.decode() ) for r in subprocess.check_output([sys.executable, '-s', '-m', 'pip', 'freeze']).split()]
     
-def fetch_plist():
-    response = requests.get(PLIST)
-    os.makedirs(os.path.dirname(PFILE), exist_ok=True)
+def load_fetch_meta():
     try:
-        if response.status_code == 200:
-            with open(PFILE, 'w', encoding='utf-8') as file:
-                file.write(response.text)
-        else:
-            cstr(f"Failed to retrieve the ComfyUI Manager plugin JSON file from: {PLIST}").error.print()
-            print(f"Status code: {response.status_code}")
+        with open(FETCH_META_FILE, 'r', encoding='utf-8') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+def save_fetch_meta(meta):
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(FETCH_META_FILE), suffix='.tmp')
+    with os.fdopen(fd, 'w', encoding='utf-8') as file:
+        json.dump(meta, file)
+    os.replace(temp_path, FETCH_META_FILE)
+
+def fetch_plist(url=PLIST, path=PFILE, force=False):
+    # Conditional download: validators are only trusted while the file on disk is the one we wrote
+    meta = load_fetch_meta()
+    entry = meta.get(url, {})
+    headers = {}
+    if not force and os.path.exists(path):
+        stat = os.stat(path)
+        if entry.get('size') == stat.st_size and entry.get('mtime_ns') == stat.st_mtime_ns:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = None
+    try:
+        with requests.get(url, headers=headers, stream=True, timeout=PLIST_TIMEOUT) as response:
+            if response.status_code == 304:
+                return False
+            if response.status_code != 200:
+                cstr(f"Failed to retrieve the ComfyUI Manager plugin JSON file from: {url}").error.print()
+                print(f"Status code: {response.status_code}")
+                return False
+
+            # Stream to a temp file beside the target so the swap is an atomic rename
+            fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.' + os.path.basename(path), suffix='.tmp')
+            with os.fdopen(fd, 'wb') as file:
+                for chunk in response.iter_content(chunk_size=65536):
+                    file.write(chunk)
+            with open(temp_path, 'r', encoding='utf-8') as file:
+                json.load(file)
+            os.replace(temp_path, path)
+            temp_path = None
+
+            stat = os.stat(path)
+            meta[url] = {
+                "etag": response.headers.get('ETag'),
+                "last_modified": response.headers.get('Last-Modified'),
+                "size": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns,
+            }
+            save_fetch_meta(meta)
+            return True
+    except requests.RequestException as e:
+        cstr(f"Unable to reach {url} to refresh the ComfyUI Manager plugin JSON file.").error.print()
+        print(e)
+    except ValueError:
+        cstr(f"The ComfyUI Manager plugin JSON file downloaded from {url} is not valid JSON.").error.print()
     except Exception:
         cstr(f"There was a general error when attempting to download the ComfyUI Manager plugin JSON file.").error.print()
         print(traceback.format_exc())
+    finally:
+        if temp_path and os.path.exists(temp_path):
+            os.remove(temp_path)
+    return False
+
+class PlistRefresher:
+    def __init__(self, sources, interval=PLIST_INTERVAL, force=False):
+        self.sources = sources
+        self.interval = interval
+        self.force = force
+        self.last_refresh = None
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def refresh(self):
+        updated = False
+        for url, path in self.sources:
+            if fetch_plist(url, path, force=self.force):
+                cstr(cstr.color.LIGHTGREEN + f"Updated {os.path.basename(path)}." + cstr.color.END).msg.print()
+                updated = True
+        self.force = False
+        self.last_refresh = time.time()
+        return updated
+
+    def run(self):
+        while not self.stop_event.is_set():
+            self.refresh()
+            if self.interval <= 0:
+                break
+            self.stop_event.wait(self.interval)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name='plist-refresher', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
 
 def load_plist():
     with open(PFILE, 'r', encoding='utf-8') as file:
         plugin_list = json.load(file)
     return plugin_list
+
+CachedJSON = collections.namedtuple('CachedJSON', ['data', 'body', 'gzip_body', 'etag'])
+
+def make_cached_json(data, etag):
+    body = json.dumps(data).encode('utf-8')
+    return CachedJSON(data, body, gzip.compress(body, compresslevel=6), etag)
+
+class JSONFileCache:
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.signature = None
+        self.entry = None
+
+    def get(self):
+        # Only re-read, re-serialize and re-compress when the file's mtime or size changed
+        stat = os.stat(self.path)
+        signature = (stat.st_mtime_ns, stat.st_size)
+        with self.lock:
+            if signature != self.signature:
+                with open(self.path, 'r', encoding='utf-8') as file:
+                    data = json.load(file)
+                self.entry = make_cached_json(data, f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"')
+                self.signature = signature
+            return self.entry
+
+def read_git_remote(folder):
+    git_path = os.path.join(folder, '.git')
+    try:
+        if os.path.isfile(git_path):
+            with open(git_path, 'r', encoding='utf-8') as file:
+                line = file.read().strip()
+            if not line.startswith('gitdir:'):
+                return None
+            git_path = os.path.join(folder, line[len('gitdir:'):].strip())
+        with open(os.path.join(git_path, 'config'), 'r', encoding='utf-8') as file:
+            lines = file.read().splitlines()
+    except OSError:
+        return None
+
+    remotes = {}
+    remote = None
+    for line in lines:
+        line = line.strip()
+        match = re.match(r'\[remote "(.+)"\]', line)
+        if match:
+            remote = match.group(1)
+        elif line.startswith('['):
+            remote = None
+        elif remote and re.match(r'url\s*=', line):
+            remotes.setdefault(remote, line.split('=', 1)[1].strip())
+    return remotes.get('origin') or next(iter(remotes.values()), None)
+
+def normalize_repo_url(url):
+    url = url.strip().lower()
+    match = re.match(r'^[\w.-]+@([\w.-]+):(.+)$', url)
+    if match:
+        url = f"{match.group(1)}/{match.group(2)}"
+    url = re.sub(r'^[a-z+]+://', '', url)
+    url = re.sub(r'^[^/@]+@', '', url)
+    url = url.rstrip('/')
+    if url.endswith('.git'):
+        url = url[:-4]
+    return url
+
+def get_installed_packages():
+    # Custom node packages only; ComfyUI's own comfy_extras modules are loaded through the same hook
+    custom_nodes = os.path.join(ROOT, 'custom_nodes')
+    installed = {}
+    for module_name, module_path in NODE_PACKAGE_PATHS.items():
+        module_path = os.path.abspath(module_path)
+        if module_path.startswith(ROOT + os.sep) and not module_path.startswith(custom_nodes + os.sep):
+            continue
+        installed[os.path.basename(module_path)] = module_path
+    return installed
+
+def build_plugin_index(plugins, installed, remotes):
+    by_remote = {}
+    by_folder = {}
+    unversioned = {}
+    for name in installed:
+        by_folder.setdefault(name.lower(), name)
+        if remotes.get(name):
+            by_remote.setdefault(normalize_repo_url(remotes[name]), name)
+        else:
+            unversioned.setdefault(name.lower(), name)
+
+    index = {
+        "installed": {},
+        "missing": [],
+        "unlisted": [],
+    }
+    for plugin in plugins.get('custom_nodes', []):
+        reference = plugin.get('reference')
+        if not reference:
+            continue
+        files = plugin.get('files') or []
+        package = None
+        if plugin.get('install_type', 'git-clone') == 'git-clone':
+            for url in [reference] + files:
+                package = by_remote.get(normalize_repo_url(url))
+                if package:
+                    break
+            if not package:
+                # Zip or manual installs have no remote to compare, fall back to the clone's folder name
+                package = unversioned.get(normalize_repo_url(files[0] if files else reference).split('/')[-1])
+        else:
+            for url in files:
+                package = by_folder.get(url.rstrip('/').split('/')[-1].lower())
+                if package:
+                    break
+        if package:
+            index["installed"][reference] = package
+        else:
+            index["missing"].append(reference)
+
+    listed = set(index["installed"].values())
+    index["unlisted"] = sorted(name for name in installed if name not in listed)
+    return index
+
+class PluginIndexCache:
+    def __init__(self, plist_cache):
+        self.plist_cache = plist_cache
+        self.lock = threading.Lock()
+        self.installed = None
+        self.remotes = None
+        self.entry = None
+
+    def read_remotes(self):
+        # Packages are fixed for the life of the server, so remotes are read once, in parallel
+        self.installed = get_installed_packages()
+        folders = {name: path for name, path in self.installed.items() if os.path.isdir(path)}
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(32, max(1, len(folders)))) as executor:
+            self.remotes = dict(zip(folders.keys(), executor.map(read_git_remote, folders.values())))
+
+    def get(self):
+        plist = self.plist_cache.get()
+        with self.lock:
+            if self.remotes is None:
+                self.read_remotes()
+            if self.entry is None or self.entry.etag != plist.etag:
+                index = build_plugin_index(plist.data, self.installed, self.remotes)
+                self.entry = make_cached_json(index, plist.etag)
+            return self.entry
+
+def get_workflow_node_types(workflow):
+    node_types = []
+    if isinstance(workflow, dict) and isinstance(workflow.get('nodes'), list):
+        # UI workflow, including nodes nested in subgraph definitions
+        graphs = [workflow] + list((workflow.get('definitions') or {}).get('subgraphs') or [])
+        for graph in graphs:
+            for node in graph.get('nodes') or []:
+                if isinstance(node, dict) and node.get('type'):
+                    node_types.append(node['type'])
+    elif isinstance(workflow, dict):
+        # API prompt
+        for node in workflow.values():
+            if isinstance(node, dict) and node.get('class_type'):
+                node_types.append(node['class_type'])
+    return node_types
+
+class NodeIndex:
+    def __init__(self, classes, plugin_index=None, node_map=None):
+        installed = get_installed_packages()
+        references = {package: reference for reference, package in (plugin_index or {}).get('installed', {}).items()}
+
+        self.providers = {}
+        for category_info in classes.values():
+            for class_name, class_info in category_info.get('classes', {}).items():
+                module_path = class_info.get('module_path') or ''
+                package = os.path.basename(NODE_PACKAGE_PATHS.get(module_path, module_path))
+                if package in installed:
+                    provider = {"package": package, "reference": references.get(package)}
+                else:
+                    provider = {"package": "ComfyUI", "reference": "https://github.com/comfyanonymous/ComfyUI"}
+                providers = self.providers.setdefault(class_name, [])
+                if provider not in providers:
+                    providers.append(provider)
+
+        self.listed = {}
+        self.patterns = []
+        for reference, entry in (node_map or {}).items():
+            if not isinstance(entry, list) or not entry:
+                continue
+            for class_name in entry[0]:
+                self.listed.setdefault(class_name, []).append(reference)
+            if len(entry) > 1 and isinstance(entry[1], dict) and entry[1].get('nodename_pattern'):
+                try:
+                    self.patterns.append((re.compile(entry[1]['nodename_pattern']), reference))
+                except re.error:
+                    pass
+
+    def resolve(self, node_types):
+        result = {
+            "resolved": {},
+            "missing": {},
+            "ambiguous": {},
+        }
+        for node_type in dict.fromkeys(node_types):
+            if node_type in VIRTUAL_NODE_TYPES:
+                continue
+            providers = self.providers.get(node_type)
+            if providers:
+                if len(providers) == 1:
+                    result["resolved"][node_type] = providers[0]
+                else:
+                    result["ambiguous"][node_type] = providers
+                continue
+            references = self.listed.get(node_type) or [reference for pattern, reference in self.patterns if pattern.search(node_type)]
+            if len(references) > 1:
+                result["ambiguous"][node_type] = [{"package": None, "reference": reference} for reference in references]
+            else:
+                result["missing"][node_type] = references[0] if references else None
+        return result
+
+class NodeIndexCache:
+    def __init__(self, dictionary_cache, plugin_index_cache, node_map_cache):
+        self.dictionary_cache = dictionary_cache
+        self.plugin_index_cache = plugin_index_cache
+        self.node_map_cache = node_map_cache
+        self.lock = threading.Lock()
+        self.signature = None
+        self.index = None
+
+    def get(self):
+        # Rebuilt only when the dictionary, plugin list or extension node map changes
+        dictionary = self.dictionary_cache.get()
+        plugin_index = self.plugin_index_cache.get() if not NO_PLIST and os.path.exists(PFILE) else None
+        node_map = self.node_map_cache.get() if not NO_PLIST and os.path.exists(self.node_map_cache.path) else None
+        signature = tuple(entry.etag if entry else None for entry in (dictionary, plugin_index, node_map))
+        with self.lock:
+            if signature != self.signature:
+                self.index = NodeIndex(
+                    dictionary.data,
+                    plugin_index.data if plugin_index else None,
+                    node_map.data if node_map else None,
+                )
+                self.signature = signature
+            return self.index
+
+NodeSignature = collections.namedtuple('NodeSignature', ['inputs', 'widgets', 'outputs'])
+
+def normalize_input_spec(spec):
+    # Scraped specs are ("MODEL",) stored as {"data_type": ["MODEL"]}, ["INT", {...}] widgets or [[options], {...}] combos
+    if isinstance(spec, dict):
+        spec = spec.get('data_type')
+    if isinstance(spec, (list, tuple)) and spec:
+        if isinstance(spec[0], list):
+            return ('COMBO', frozenset(option for option in spec[0] if not isinstance(option, (list, dict))))
+        if isinstance(spec[0], str):
+            if spec[0] == 'COMBO' and len(spec) > 1 and isinstance(spec[1], dict) and isinstance(spec[1].get('options'), list):
+                return ('COMBO', frozenset(option for option in spec[1]['options'] if not isinstance(option, (list, dict))))
+            return (spec[0], None)
+    return (None, None)
+
+def types_compatible(output_type, input_type):
+    if not output_type or not input_type or '*' in (output_type, input_type):
+        return True
+    if input_type == 'COMBO' or output_type == 'COMBO':
+        return True
+    return bool(set(output_type.split(',')) & set(input_type.split(',')))
+
+class WorkflowValidator:
+    WIDGET_TYPES = ["INT", "FLOAT", "STRING", "BOOLEAN", "COMBO"]
+    CONTROL_VALUES = ["fixed", "increment", "decrement", "randomize"]
+
+    def __init__(self, classes):
+        # Signature tables are built once per dictionary and shared across every workflow in a batch
+        self.signatures = {}
+        self.input_names = set()
+        for category_info in classes.values():
+            for class_name, class_info in category_info.get('classes', {}).items():
+                inputs = {}
+                widgets = []
+                for group in ('required', 'optional'):
+                    for name, spec in (class_info.get('input_types', {}).get(group) or {}).items():
+                        input_type, options = normalize_input_spec(spec)
+                        inputs[name] = (input_type, options)
+                        self.input_names.add(name.lower())
+                        if input_type in self.WIDGET_TYPES:
+                            widgets.append(name)
+                outputs = [output if isinstance(output, str) else 'COMBO' for output in class_info.get('return_types') or []]
+                self.signatures.setdefault(class_name, NodeSignature(inputs, widgets, outputs))
+
+    def check_value(self, errors, node_id, node_type, signature, name, value):
+        input_type, options = signature.inputs.get(name, (None, None))
+        if options is None or not options:
+            return
+        try:
+            valid = value in options
+        except TypeError:
+            return
+        if not valid:
+            errors.append({"node": node_id, "type": node_type, "issue": "invalid_value", "input": name, "value": value})
+
+    def widget_items(self, signature, values):
+        if isinstance(values, dict):
+            return list(values.items())
+        items = []
+        if isinstance(values, list):
+            index = 0
+            for name in signature.widgets:
+                if index >= len(values):
+                    break
+                items.append((name, values[index]))
+                index += 1
+                # Seed widgets carry an extra "control after generate" value
+                if signature.inputs[name][0] == 'INT' and index < len(values) and values[index] in self.CONTROL_VALUES:
+                    index += 1
+        return items
+
+    def validate_ui(self, workflow):
+        errors = []
+        subgraphs = [subgraph.get('id') for subgraph in (workflow.get('definitions') or {}).get('subgraphs') or []]
+        graphs = [workflow] + list((workflow.get('definitions') or {}).get('subgraphs') or [])
+        for graph in graphs:
+            nodes = {node.get('id'): node for node in graph.get('nodes') or [] if isinstance(node, dict)}
+            for node_id, node in nodes.items():
+                node_type = node.get('type')
+                if node_type in VIRTUAL_NODE_TYPES or node_type in subgraphs:
+                    continue
+                signature = self.signatures.get(node_type)
+                if signature is None:
+                    errors.append({"node": node_id, "type": node_type, "issue": "unknown_node"})
+                    continue
+                for name, value in self.widget_items(signature, node.get('widgets_values')):
+                    self.check_value(errors, node_id, node_type, signature, name, value)
+
+            for link in graph.get('links') or []:
+                if isinstance(link, dict):
+                    link = [link.get('id'), link.get('origin_id'), link.get('origin_slot'), link.get('target_id'), link.get('target_slot'), link.get('type')]
+                if not isinstance(link, list) or len(link) < 5:
+                    continue
+                origin, target = nodes.get(link[1]), nodes.get(link[3])
+                if not origin or not target:
+                    continue
+                origin_signature = self.signatures.get(origin.get('type'))
+                target_signature = self.signatures.get(target.get('type'))
+                if not origin_signature or not target_signature:
+                    continue
+                try:
+                    output_type = origin_signature.outputs[link[2]]
+                    name = (target.get('inputs') or [])[link[4]].get('name')
+                except (IndexError, TypeError, AttributeError):
+                    continue
+                input_type = target_signature.inputs.get(name, (None, None))[0]
+                if not types_compatible(output_type, input_type):
+                    errors.append({"node": link[3], "type": target.get('type'), "issue": "type_mismatch", "input": name, "value": output_type, "expected": input_type})
+        return errors
+
+    def validate_prompt(self, prompt):
+        errors = []
+        for node_id, node in prompt.items():
+            if not isinstance(node, dict):
+                continue
+            node_type = node.get('class_type')
+            signature = self.signatures.get(node_type)
+            if signature is None:
+                errors.append({"node": node_id, "type": node_type, "issue": "unknown_node"})
+                continue
+            for name, value in (node.get('inputs') or {}).items():
+                if isinstance(value, list) and len(value) == 2 and isinstance(value[1], int):
+                    origin = prompt.get(str(value[0]))
+                    origin_signature = self.signatures.get(origin.get('class_type')) if isinstance(origin, dict) else None
+                    if not origin_signature or value[1] >= len(origin_signature.outputs):
+                        continue
+                    input_type = signature.inputs.get(name, (None, None))[0]
+                    if not types_compatible(origin_signature.outputs[value[1]], input_type):
+                        errors.append({"node": node_id, "type": node_type, "issue": "type_mismatch", "input": name, "value": origin_signature.outputs[value[1]], "expected": input_type})
+                else:
+                    self.check_value(errors, node_id, node_type, signature, name, value)
+        return errors
+
+    def validate(self, workflow):
+        if isinstance(workflow, (str, bytes)):
+            workflow = json.loads(workflow)
+        if not isinstance(workflow, dict):
+            raise ValueError("Workflow must be a JSON object")
+        if isinstance(workflow.get('nodes'), list):
+            return self.validate_ui(workflow)
+        return self.validate_prompt(workflow)
+
+    def validate_batch(self, workflows):
+        results = []
+        for name, workflow in workflows:
+            try:
+                errors = self.validate(workflow)
+                results.append({"name": name, "valid": not errors, "errors": errors})
+            except Exception as e:
+                results.append({"name": name, "valid": False, "errors": [{"issue": "unreadable", "value": str(e)}]})
+        return {
+            "results": results,
+            "summary": {
+                "workflows": len(results),
+                "invalid": sum(1 for result in results if not result["valid"]),
+                "errors": sum(len(result["errors"]) for result in results),
+            },
+        }
+
+class WorkflowValidatorCache:
+    def __init__(self, dictionary_cache):
+        self.dictionary_cache = dictionary_cache
+        self.lock = threading.Lock()
+        self.etag = None
+        self.validator = None
+
+    def get(self):
+        dictionary = self.dictionary_cache.get()
+        with self.lock:
+            if dictionary.etag != self.etag:
+                self.validator = WorkflowValidator(dictionary.data)
+                self.etag = dictionary.etag
+            return self.validator
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+PNG_TEXT_KEYS = ("workflow", "prompt")
+PNG_TEXT_LIMIT = 64 * 1024 * 1024
+
+def decode_png_text(chunk_type, data):
+    if chunk_type == b'tEXt':
+        return data.decode('latin-1')
+    if chunk_type == b'zTXt':
+        compressed, encoding = data[1:], 'latin-1'
+    else:
+        flag, text = data[0], data[2:].split(b'\0', 2)[2]
+        if not flag:
+            return text.decode('utf-8')
+        compressed, encoding = text, 'utf-8'
+    decompressor = zlib.decompressobj()
+    text = decompressor.decompress(compressed, PNG_TEXT_LIMIT)
+    if decompressor.unconsumed_tail:
+        raise ValueError("PNG text chunk is too large")
+    return text.decode(encoding)
+
+def read_png_metadata(full_path, keys=PNG_TEXT_KEYS):
+    # Walks chunk headers and seeks past everything but IHDR and text chunks, stopping at the first IDAT.
+    # Returns None when the file isn't a PNG.
+    text = {}
+    with open(full_path, 'rb') as file:
+        if file.read(8) != PNG_SIGNATURE:
+            return None
+        header = file.read(8)
+        if len(header) < 8 or header[4:] != b'IHDR':
+            return None
+        size = file.read(8)
+        if len(size) < 8:
+            return None
+        width, height = struct.unpack('>II', size)
+        file.seek(struct.unpack('>I', header[:4])[0] - 8 + 4, 1)
+        while True:
+            header = file.read(8)
+            if len(header) < 8:
+                break
+            length, chunk_type = struct.unpack('>I4s', header)
+            if chunk_type in (b'IDAT', b'IEND'):
+                break
+            if chunk_type not in (b'tEXt', b'zTXt', b'iTXt'):
+                file.seek(length + 4, 1)
+                continue
+            # Keywords are at most 79 bytes, so the name is known before the value is read
+            data = file.read(min(length, 80))
+            keyword = data.partition(b'\0')[0].decode('latin-1')
+            if keys is not None and (keyword not in keys or keyword in text):
+                file.seek(length - len(data) + 4, 1)
+                continue
+            data += file.read(length - len(data))
+            file.seek(4, 1)
+            try:
+                text[keyword] = decode_png_text(chunk_type, data[len(keyword) + 1:])
+            except (ValueError, IndexError, zlib.error, UnicodeDecodeError):
+                continue
+            if keys is not None and len(text) == len(keys):
+                break
+    return width, height, text
+
+EXIF_USER_COMMENT = 0x9286
+EXIF_IFD_POINTER = 0x8769
+JPEG_SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+XMP_NAMESPACE = b'http://ns.adobe.com/xap/1.0/\0'
+
+def decode_user_comment(data, byte_order):
+    # The first 8 bytes name the character code; ComfyUI savers and A1111 use ASCII or UNICODE (UTF-16)
+    prefix, data = data[:8], data[8:]
+    if prefix.startswith(b'UNICODE'):
+        if data[:2] in (b'\xff\xfe', b'\xfe\xff'):
+            return data.decode('utf-16')
+        # Writers disagree on the byte order; for mostly-ASCII text the zero bytes give it away
+        if data[0::2].count(0) != data[1::2].count(0):
+            return data.decode('utf-16-be' if data[0::2].count(0) > data[1::2].count(0) else 'utf-16-le')
+        return data.decode('utf-16-le' if byte_order == '<' else 'utf-16-be')
+    return data.decode('utf-8', 'replace')
+
+def classify_metadata_text(value, text):
+    # Savers write "workflow:{...}" / "Prompt:{...}", or only the bare JSON, into Exif strings
+    key, separator, rest = value.partition(':')
+    if separator and re.fullmatch(r'[A-Za-z_]\w*', key) and rest.lstrip().startswith(('{', '[')):
+        text.setdefault(key.lower() if key.lower() in PNG_TEXT_KEYS else key, rest.strip())
+    elif value.lstrip()[:1] == '{':
+        try:
+            data = json.loads(value)
+        except ValueError:
+            return
+        if isinstance(data, dict) and 'nodes' in data:
+            text.setdefault('workflow', value.strip())
+        elif isinstance(data, dict) and all(isinstance(node, dict) and 'class_type' in node for node in data.values()):
+            text.setdefault('prompt', value.strip())
+
+def read_exif_text(data, text):
+    # Reads the byte, ASCII and UNDEFINED strings of IFD0 and the Exif IFD from a TIFF structure
+    if data.startswith(b'Exif\0\0'):
+        data = data[6:]
+    if len(data) < 8 or data[:4] not in (b'II*\0', b'MM\0*'):
+        return
+    byte_order = '<' if data[:2] == b'II' else '>'
+    offsets = [struct.unpack(byte_order + 'I', data[4:8])[0]]
+    visited = set()
+    while offsets:
+        offset = offsets.pop()
+        if offset in visited or offset + 2 > len(data):
+            continue
+        visited.add(offset)
+        count = struct.unpack(byte_order + 'H', data[offset:offset + 2])[0]
+        for index in range(count):
+            entry = data[offset + 2 + index * 12:offset + 14 + index * 12]
+            if len(entry) < 12:
+                break
+            tag, kind, length = struct.unpack(byte_order + 'HHI', entry[:8])
+            if tag == EXIF_IFD_POINTER:
+                offsets.append(struct.unpack(byte_order + 'I', entry[8:])[0])
+                continue
+            if kind not in (1, 2, 7):
+                continue
+            if length <= 4:
+                value = entry[8:8 + length]
+            else:
+                start = struct.unpack(byte_order + 'I', entry[8:])[0]
+                value = data[start:start + length]
+            try:
+                value = decode_user_comment(value, byte_order) if tag == EXIF_USER_COMMENT else value.rstrip(b'\0').decode('utf-8')
+            except UnicodeDecodeError:
+                continue
+            classify_metadata_text(value.rstrip('\0'), text)
+
+def read_xmp_text(data, text):
+    data = data.decode('utf-8', 'replace')
+    for match in re.finditer(r'<(?:[\w-]+:)?(workflow|prompt)>(.*?)</(?:[\w-]+:)?\1>|(?:[\w-]+:)?(workflow|prompt)="([^"]*)"', data, re.S | re.I):
+        key, value = (match.group(1), match.group(2)) if match.group(1) else (match.group(3), match.group(4))
+        text.setdefault(key.lower(), html.unescape(value).strip())
+
+def filter_metadata_text(text, keys):
+    return text if keys is None else {key: value for key, value in text.items() if key in keys}
+
+def read_webp_metadata(full_path, keys=PNG_TEXT_KEYS):
+    # Walks the RIFF chunks, reading only the frame header for the size and the EXIF and XMP chunks.
+    # Returns None when the file isn't a WebP.
+    text = {}
+    width = height = None
+    with open(full_path, 'rb') as file:
+        header = file.read(12)
+        if len(header) < 12 or header[:4] != b'RIFF' or header[8:] != b'WEBP':
+            return None
+        while True:
+            header = file.read(8)
+            if len(header) < 8:
+                break
+            chunk_type, length = struct.unpack('<4sI', header)
+            padded = length + (length & 1)
+            if chunk_type in (b'VP8X', b'VP8 ', b'VP8L') and width is None:
+                data = file.read(min(length, 10))
+                file.seek(padded - len(data), 1)
+                if chunk_type == b'VP8X' and len(data) >= 10:
+                    width = int.from_bytes(data[4:7], 'little') + 1
+                    height = int.from_bytes(data[7:10], 'little') + 1
+                elif chunk_type == b'VP8 ' and len(data) >= 10:
+                    width, height = (value & 0x3FFF for value in struct.unpack('<HH', data[6:10]))
+                elif chunk_type == b'VP8L' and len(data) >= 5:
+                    bits = struct.unpack('<I', data[1:5])[0]
+                    width, height = (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+            elif chunk_type in (b'EXIF', b'XMP ') and length <= PNG_TEXT_LIMIT:
+                data = file.read(padded)[:length]
+                (read_exif_text if chunk_type == b'EXIF' else read_xmp_text)(data, text)
+            else:
+                file.seek(padded, 1)
+    return width, height, filter_metadata_text(text, keys)
+
+def read_jpeg_metadata(full_path, keys=PNG_TEXT_KEYS):
+    # Walks the marker segments up to the start of scan, reading APP1 (Exif, XMP) and the frame header.
+    # Returns None when the file isn't a JPEG.
+    text = {}
+    width = height = None
+    with open(full_path, 'rb') as file:
+        if file.read(2) != b'\xff\xd8':
+            return None
+        while True:
+            marker = file.read(2)
+            while marker[:1] == b'\xff' and marker[1:] == b'\xff':
+                marker = marker[1:] + file.read(1)
+            if len(marker) < 2 or marker[0] != 0xFF or marker[1] in (0xD9, 0xDA):
+                break
+            if 0xD0 <= marker[1] <= 0xD7 or marker[1] == 0x01:
+                continue
+            header = file.read(2)
+            if len(header) < 2:
+                break
+            length = struct.unpack('>H', header)[0] - 2
+            if length < 0:
+                break
+            if marker[1] == 0xE1:
+                data = file.read(length)
+                if data.startswith(b'Exif\0\0'):
+                    read_exif_text(data, text)
+                elif data.startswith(XMP_NAMESPACE):
+                    read_xmp_text(data[len(XMP_NAMESPACE):], text)
+            elif marker[1] in JPEG_SOF_MARKERS:
+                data = file.read(length)
+                if len(data) >= 5:
+                    height, width = struct.unpack('>HH', data[1:5])
+            else:
+                file.seek(length, 1)
+    return width, height, filter_metadata_text(text, keys)
+
+METADATA_READERS = {
+    ".png": ("PNG", read_png_metadata),
+    ".webp": ("WEBP", read_webp_metadata),
+    ".jpg": ("JPEG", read_jpeg_metadata),
+    ".jpeg": ("JPEG", read_jpeg_metadata),
+}
+
+def read_file_metadata(full_path, keys=PNG_TEXT_KEYS):
+    # Returns (width, height, text) from the format's metadata reader, or None for formats without one
+    reader = METADATA_READERS.get(os.path.splitext(full_path)[1].lower())
+    return reader[1](full_path, keys) if reader else None
+
+def read_image_workflow(full_path):
+    metadata = read_file_metadata(full_path)
+    text = metadata[2] if metadata else {}
+    return text.get('workflow') or text.get('prompt')
+
+def search_input_row(node_type, name, value):
+    # Links, lists and long texts aren't useful as key:value lookups
+    if isinstance(value, bool):
+        value = str(value).lower()
+    if isinstance(value, (int, float)):
+        return (node_type, name, str(value), None, float(value))
+    if isinstance(value, str) and value and len(value) <= SEARCH_VALUE_MAX:
+        base = re.split(r'[\\/]', value)[-1]
+        return (node_type, name, value, base if base != value else None, None)
+    return None
+
+def is_prompt_input(node_type, name, value):
+    return isinstance(value, str) and value.strip() != '' and (name.lower() in SEARCH_PROMPT_INPUTS or 'TextEncode' in node_type)
+
+def extract_image_inputs(workflow, prompt, validator=None):
+    # Returns the node types in the image, its (node type, input, value, file name, number) rows and its prompt texts
+    node_types = set()
+    rows = set()
+    prompts = []
+    try:
+        prompt = json.loads(prompt) if prompt else {}
+    except ValueError:
+        prompt = {}
+    for node in prompt.values() if isinstance(prompt, dict) else []:
+        if not isinstance(node, dict) or not isinstance(node.get('class_type'), str):
+            continue
+        node_types.add(node['class_type'])
+        for name, value in (node.get('inputs') or {}).items():
+            row = search_input_row(node['class_type'], name, value)
+            if row:
+                rows.add(row)
+            if is_prompt_input(node['class_type'], name, value) and value not in prompts:
+                prompts.append(value)
+    try:
+        workflow = json.loads(workflow) if workflow else {}
+    except ValueError:
+        workflow = {}
+    graphs = [workflow] + list((workflow.get('definitions') or {}).get('subgraphs') or []) if isinstance(workflow, dict) else []
+    for graph in graphs:
+        for node in graph.get('nodes') or []:
+            if not isinstance(node, dict) or not isinstance(node.get('type'), str):
+                continue
+            node_types.add(node['type'])
+            # The prompt already names every input; UI widgets are only mapped when it is missing
+            signature = validator.signatures.get(node['type']) if validator and not prompt else None
+            for name, value in validator.widget_items(signature, node.get('widgets_values')) if signature else []:
+                row = search_input_row(node['type'], name, value)
+                if row:
+                    rows.add(row)
+                if is_prompt_input(node['type'], name, value) and value not in prompts:
+                    prompts.append(value)
+            # Without the dictionary, text encoder widgets are still recognisable as prompts
+            if not prompt and not signature and 'TextEncode' in node['type'] and isinstance(node.get('widgets_values'), list):
+                prompts += [value for value in node['widgets_values'] if is_prompt_input(node['type'], '', value) and value not in prompts]
+    return node_types, rows, prompts
+
+def parse_search_query(query, input_names=()):
+    # node:KSampler seed:12345 ckpt:sdxl_base -> filters when the key is an alias, a node key or a known input name;
+    # anything else (masterpiece:1.2, embedding:foo, URLs) stays a plain term
+    try:
+        tokens = shlex.split(query)
+    except ValueError:
+        tokens = query.split()
+    filters = []
+    terms = []
+    for token in tokens:
+        match = re.fullmatch(r'([A-Za-z_][\w.]*):(.+)', token)
+        key = match.group(1).lower() if match else None
+        if key not in SEARCH_NODE_KEYS and key not in SEARCH_ALIASES and key not in input_names:
+            terms.append(token)
+            continue
+        value = match.group(2)
+        names = None if key in SEARCH_NODE_KEYS else SEARCH_ALIASES.get(key, [match.group(1)])
+        try:
+            number = float(value)
+        except ValueError:
+            number = None
+        filters.append((names, value, number))
+    return filters, terms
+
+def search_filter_matches(search_filter, node_types, rows):
+    names, value, number = search_filter
+    if names is None:
+        return any(node_type.lower() == value.lower() for node_type in node_types)
+    names = {name.lower() for name in names}
+    value = value.lower()
+    for _, name, text, base, row_number in rows:
+        if name.lower() not in names:
+            continue
+        if number is not None and row_number is not None:
+            if row_number == number:
+                return True
+        elif text.lower().startswith(value) or (base or '').lower().startswith(value):
+            return True
+    return False
+
+def prompt_match_query(terms):
+    # Every term becomes an FTS5 phrase, so quoted words stay together and operators in prompts are taken literally
+    phrases = []
+    for term in terms:
+        prefix = term.endswith('*') and len(term) > 1
+        phrases.append('"' + term.rstrip('*').replace('"', '""') + '"' + ('*' if prefix else ''))
+    return ' '.join(phrases)
+
+def workflow_digest(workflow, text):
+    return hashlib.sha256(((workflow or '') + '\0' + (text or '')).encode('utf-8', 'surrogatepass')).digest()
+
+def escape_like(text):
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+def benchmark_metadata(paths):
+    files = [path for path in collect_workflow_files(paths) if path.lower().endswith('.png')]
+
+    def pillow(path):
+        with Image.open(path) as image:
+            return {key: value for key, value in image.text.items() if key in PNG_TEXT_KEYS}
+
+    def streaming(path):
+        metadata = read_png_metadata(path)
+        return metadata[2] if metadata else {}
+
+    results = {}
+    for name, reader in (("Image.open().text", pillow), ("read_png_metadata", streaming)):
+        outputs = []
+        started = time.perf_counter()
+        for path in files:
+            try:
+                outputs.append(reader(path))
+            except Exception:
+                outputs.append(None)
+        results[name] = (time.perf_counter() - started, outputs)
+        elapsed = results[name][0]
+        cstr(f"{name}: {len(files)} PNG files in {elapsed:.3f}s ({elapsed / max(1, len(files)) * 1000:.2f} ms per file)").msg.print()
+    (pillow_time, pillow_outputs), (streaming_time, streaming_outputs) = results.values()
+    mismatches = sum(1 for a, b in zip(pillow_outputs, streaming_outputs) if a != b)
+    cstr(f"Speedup {pillow_time / max(streaming_time, 1e-9):.1f}x, {mismatches} files with different workflow or prompt text.").msg.print()
+    return mismatches
+
+def collect_workflow_files(paths):
+    workflows = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                for file in sorted(files):
+                    if os.path.splitext(file)[1].lower() in ALLOWED_EXTENSIONS + ['.json']:
+                        workflows.append(os.path.join(root, file))
+        else:
+            workflows.append(path)
+    return workflows
+
+def load_workflow_file(path):
+    if os.path.splitext(path)[1].lower() == '.json':
+        with open(path, 'r', encoding='utf-8') as file:
+            return file.read()
+    workflow = read_image_workflow(path)
+    if workflow is None:
+        raise ValueError("No workflow metadata found")
+    return workflow
+
+def load_workflows(paths, loader=load_workflow_file):
+    # Reading is I/O bound, validation is not; read in parallel, hand back in order
+    def load(path):
+        try:
+            return path, loader(path)
+        except Exception as e:
+            return path, e
+    with concurrent.futures.ThreadPoolExecutor(max_workers=min(32, (os.cpu_count() or 1) * 4)) as executor:
+        return list(executor.map(load, paths))
+
+def validate_workflow_paths(validator, paths):
+    workflows = []
+    unreadable = []
+    for path, workflow in load_workflows(collect_workflow_files(paths)):
+        if isinstance(workflow, Exception):
+            unreadable.append({"name": path, "valid": False, "errors": [{"issue": "unreadable", "value": str(workflow)}]})
+        else:
+            workflows.append((path, workflow))
+    report = validator.validate_batch(workflows)
+    report["results"].extend(unreadable)
+    report["summary"]["workflows"] += len(unreadable)
+    report["summary"]["invalid"] += len(unreadable)
+    report["summary"]["errors"] += len(unreadable)
+    return report
+
+def cached_json_response(request, entry):
+    # Each encoding is a different representation, so the gzip body gets its own ETag
+    compressed = 'gzip' in request.headers.get('Accept-Encoding', '')
+    etag = entry.etag[:-1] + '-gzip"' if compressed else entry.etag
+    headers = {
+        'ETag': etag,
+        'Cache-Control': 'no-cache',
+        'Vary': 'Accept-Encoding',
+    }
+    if etag in [tag.strip().removeprefix('W/') for tag in request.headers.get('If-None-Match', '').split(',')]:
+        return web.Response(status=304, headers=headers)
+    if compressed:
+        headers['Content-Encoding'] = 'gzip'
+        return web.Response(body=entry.gzip_body, content_type='application/json', headers=headers)
+    return web.Response(body=entry.body, content_type='application/json', headers=headers)
     
 def filter_arguments(allowed_args):
     filtered_args = [arg for arg in sys.argv if arg in allowed_args]
@@ -195,6 +1203,7 @@ def load_custom_node_categorized(module_path):
         if hasattr(module, "NODE_CLASS_MAPPINGS") and getattr(module, "NODE_CLASS_MAPPINGS") is not None:
             if not NODE_CLASS_MAPPINGS_CATEGORIZED.__contains__(module_name):
                 NODE_CLASS_MAPPINGS_CATEGORIZED.update({module_name: {}})
+                NODE_PACKAGE_PATHS.update({module_name: module_path})
             NODE_CLASS_MAPPINGS.update(module.NODE_CLASS_MAPPINGS)
             NODE_CLASS_MAPPINGS_CATEGORIZED[module_name].update(module.NODE_CLASS_MAPPINGS)
             if hasattr(module, "NODE_DISPLAY_NAME_MAPPINGS") and getattr(module, "NODE_DISPLAY_NAME_MAPPINGS") is not None:
@@ -234,97 +1243,1358 @@ async def log_request_middleware(app, handler):
         return response
     return middleware
 
-def get_paths(category, path):
+GALLERY_SORT_KEYS = {
+    "name": lambda item: item[0],
+    "mtime": lambda item: (item[1].st_mtime_ns, item[0]),
+    "size": lambda item: (item[1].st_size, item[0])
+}
+
+Listing = collections.namedtuple("Listing", ["folder", "relative", "mtime_ns", "directories", "images", "orders"])
+
+def scan_directory(folder):
+    directories = []
+    images = []
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            try:
+                if entry.is_dir():
+                    directories.append((entry.name, entry.stat()))
+                elif os.path.splitext(entry.name)[1].lower() in ALLOWED_EXTENSIONS:
+                    images.append((entry.name, entry.stat()))
+            except OSError:
+                continue
+    return directories, images
+
+def gallery_relative_path(path):
+    return '' if path.startswith('/') else path.strip('/')
+
+def list_directory(category, path):
+    relative = gallery_relative_path(path)
+    folder = resolve_image_path(category, relative)
+    if not folder:
+        return None
+    try:
+        # Stat before scanning, so an entry added mid-scan still invalidates the cached listing
+        mtime_ns = os.stat(folder).st_mtime_ns
+        directories, images = scan_directory(folder)
+    except OSError as e:
+        cstr(f"There was an error with a path request for category `{category}` and path `{path}`").error.print()
+        print(e)
+        return None
+    return Listing(folder, relative, mtime_ns, directories, images, {})
+
+def listing_current(listing):
+    # An image overwritten in place leaves the folder's mtime alone, so each file's size and mtime are checked too
+    for name, stat in listing.images:
+        try:
+            current = os.stat(os.path.join(listing.folder, name))
+        except OSError:
+            return False
+        if (current.st_size, current.st_mtime_ns) != (stat.st_size, stat.st_mtime_ns):
+            return False
+    return True
+
+class ListingCache:
+    # A folder's mtime moves whenever an entry is added, removed or renamed. Files rewritten in place reach the cache
+    # through CATALOG.on_change while inotify is watching; otherwise each listing's file stats are re-checked every
+    # GALLERY_LISTING_REVALIDATE seconds instead of on every request.
+    def __init__(self, max_entries=GALLERY_LISTING_CACHE_ENTRIES, revalidate=GALLERY_LISTING_REVALIDATE):
+        self.max_entries = max_entries
+        self.revalidate = revalidate
+        self.lock = threading.Lock()
+        self.entries = collections.OrderedDict()
+        self.checked = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, category, path):
+        key = (category, gallery_relative_path(path))
+        folder = resolve_image_path(*key)
+        try:
+            mtime_ns = os.stat(folder).st_mtime_ns if folder else None
+        except OSError:
+            mtime_ns = None
+        with self.lock:
+            listing = self.entries.get(key)
+        if listing is not None and listing.mtime_ns == mtime_ns and self.current(key, listing):
+            with self.lock:
+                if key in self.entries:
+                    self.entries.move_to_end(key)
+                self.hits += 1
+            return listing
+        with self.lock:
+            self.entries.pop(key, None)
+            self.checked.pop(key, None)
+            self.misses += 1
+        if mtime_ns is None:
+            return None
+        listing = CATALOG.listing(*key, folder, mtime_ns) if CATALOG else None
+        if listing is None or not self.current(key, listing):
+            listing = list_directory(category, path)
+            if CATALOG:
+                CATALOG.request(*key)
+        if listing is not None:
+            with self.lock:
+                self.entries[key] = listing
+                self.entries.move_to_end(key)
+                self.checked.setdefault(key, time.monotonic())
+                while len(self.entries) > self.max_entries:
+                    self.checked.pop(self.entries.popitem(last=False)[0], None)
+        return listing
+
+    def current(self, key, listing):
+        if GALLERY_WATCHER and GALLERY_WATCHER.watching(*key):
+            return True
+        now = time.monotonic()
+        with self.lock:
+            if now - self.checked.get(key, float('-inf')) < self.revalidate:
+                return True
+        if not listing_current(listing):
+            return False
+        with self.lock:
+            self.checked[key] = now
+        return True
+
+    def pop(self, category, relative):
+        with self.lock:
+            self.entries.pop((category, relative), None)
+            self.checked.pop((category, relative), None)
+
+    def stats(self):
+        return {
+            "entries": len(self.entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+def get_paths(listing, offset=0, limit=0, sort="name", order="asc"):
     result = {
         "directories": [],
-        "images": []
+        "images": [],
+        "total": 0,
+        "offset": offset,
+        "limit": limit
     }
+    if listing is None:
+        return result
+
+    prefix = listing.relative + '/' if listing.relative else ''
+    # Directories come with the first page only, so appended pages don't repeat them
+    if offset == 0:
+        result["directories"] = sorted(prefix + name for name, _ in listing.directories)
+
+    images = listing.orders.get((sort, order))
+    if images is None:
+        images = listing.orders[(sort, order)] = sorted(listing.images, key=GALLERY_SORT_KEYS[sort], reverse=(order == "desc"))
+    page = images[offset:offset + limit] if limit else images[offset:]
+    result["images"] = [{"path": prefix + name, "size": stat.st_size, "mtime": stat.st_mtime_ns / 1e9} for name, stat in page]
+    result["total"] = len(images)
+    return result
+
+CatalogStat = collections.namedtuple("CatalogStat", ["st_size", "st_mtime_ns"])
+
+def read_image_metadata(full_path):
+    format, reader = METADATA_READERS.get(os.path.splitext(full_path)[1].lower(), (None, None))
+    metadata = reader(full_path, keys=None) if reader else None
+    if metadata and metadata[0] is not None:
+        return metadata[0], metadata[1], format, metadata[2]
+    with Image.open(full_path) as image:
+        # info only holds the text chunks read with the header; image.text would decode the pixels to find later ones
+        text = {key: value for key, value in image.info.items() if isinstance(key, str) and isinstance(value, str)}
+        return image.width, image.height, image.format, text
+
+class ImageCatalog:
+    # SQLite index of every gallery image. A folder's listing is served from here while its mtime matches the one it was indexed at.
+    SCHEMA = """
+        CREATE TABLE folders (
+            category TEXT NOT NULL,
+            path TEXT NOT NULL,
+            parent TEXT,
+            mtime_ns INTEGER NOT NULL,
+            indexed_ns INTEGER,
+            PRIMARY KEY (category, path)
+        );
+        CREATE INDEX folders_parent ON folders (category, parent);
+        CREATE TABLE workflows (
+            id INTEGER PRIMARY KEY,
+            hash BLOB NOT NULL UNIQUE,
+            workflow TEXT,
+            text TEXT
+        );
+        CREATE TABLE images (
+            id INTEGER PRIMARY KEY,
+            category TEXT NOT NULL,
+            folder TEXT NOT NULL,
+            name TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            width INTEGER,
+            height INTEGER,
+            format TEXT,
+            workflow INTEGER REFERENCES workflows (id),
+            UNIQUE (category, folder, name)
+        );
+        CREATE INDEX images_mtime ON images (mtime_ns);
+        CREATE INDEX images_workflow ON images (workflow);
+        CREATE TABLE workflow_nodes (
+            node_type TEXT NOT NULL COLLATE NOCASE,
+            workflow INTEGER NOT NULL,
+            PRIMARY KEY (node_type, workflow)
+        ) WITHOUT ROWID;
+        CREATE INDEX workflow_nodes_workflow ON workflow_nodes (workflow);
+        CREATE TABLE workflow_inputs (
+            workflow INTEGER NOT NULL,
+            node_type TEXT NOT NULL,
+            input TEXT NOT NULL COLLATE NOCASE,
+            value TEXT COLLATE NOCASE,
+            base TEXT COLLATE NOCASE,
+            number REAL
+        );
+        CREATE INDEX workflow_inputs_workflow ON workflow_inputs (workflow);
+        CREATE INDEX workflow_inputs_value ON workflow_inputs (input, value);
+        CREATE INDEX workflow_inputs_base ON workflow_inputs (input, base);
+        CREATE INDEX workflow_inputs_number ON workflow_inputs (input, number);
+        CREATE TRIGGER images_delete AFTER DELETE ON images WHEN old.workflow IS NOT NULL BEGIN
+            DELETE FROM workflows WHERE id = old.workflow AND NOT EXISTS (SELECT 1 FROM images WHERE workflow = old.workflow);
+        END;
+        CREATE TRIGGER images_update AFTER UPDATE OF workflow ON images WHEN old.workflow IS NOT new.workflow AND old.workflow IS NOT NULL BEGIN
+            DELETE FROM workflows WHERE id = old.workflow AND NOT EXISTS (SELECT 1 FROM images WHERE workflow = old.workflow);
+        END;
+        CREATE TRIGGER workflows_delete AFTER DELETE ON workflows BEGIN
+            DELETE FROM workflow_nodes WHERE workflow = old.id;
+            DELETE FROM workflow_inputs WHERE workflow = old.id;
+        END;
+    """
+    # Kept apart from SCHEMA so a SQLite built without FTS5 still gets a catalog, searched with LIKE instead
+    PROMPT_SCHEMA = """
+        CREATE VIRTUAL TABLE workflow_prompts USING fts5(text, tokenize = 'unicode61 remove_diacritics 2');
+        CREATE TRIGGER workflows_delete_prompts AFTER DELETE ON workflows BEGIN
+            DELETE FROM workflow_prompts WHERE rowid = old.id;
+        END;
+    """
+    # Tables of older schema versions are dropped along with the current ones
+    TABLES = ["workflow_prompts", "workflow_inputs", "workflow_nodes", "image_prompts", "image_inputs", "image_nodes", "images", "workflows", "folders"]
+
+    def __init__(self, path=CATALOG_FILE, interval=CATALOG_INTERVAL):
+        self.path = path
+        self.interval = interval
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.write_lock = threading.RLock()
+        self.on_change = None
+        self.pending = set()
+        self.wake = threading.Event()
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.executor = None
+        self.indexing = False
+        self.last_indexed = None
+        connection = self.connect()
+        if connection.execute("PRAGMA user_version").fetchone()[0] != CATALOG_SCHEMA_VERSION:
+            connection.executescript("".join(f"DROP TABLE IF EXISTS {table};" for table in self.TABLES) + self.SCHEMA + f"PRAGMA user_version = {CATALOG_SCHEMA_VERSION};")
+            try:
+                connection.executescript(self.PROMPT_SCHEMA)
+            except sqlite3.OperationalError as e:
+                cstr(f"SQLite has no FTS5 support, prompt search falls back to LIKE: {e}").warning.print()
+        self.fts = connection.execute("SELECT 1 FROM sqlite_master WHERE name = 'workflow_prompts'").fetchone() is not None
+        # A catalog left by a previous run answers searches until the first pass catches up
+        self.ready = connection.execute("SELECT 1 FROM folders LIMIT 1").fetchone() is not None
+
+    def connect(self):
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self.local.connection = connection
+        return connection
+
+    def listing(self, category, relative, folder, mtime_ns):
+        connection = self.connect()
+        row = connection.execute("SELECT indexed_ns FROM folders WHERE category = ? AND path = ?", (category, relative)).fetchone()
+        if row is None or row[0] != mtime_ns:
+            return None
+        prefix = relative + '/' if relative else ''
+        directories = [(path[len(prefix):], CatalogStat(0, mtime)) for path, mtime in connection.execute(
+            "SELECT path, mtime_ns FROM folders WHERE category = ? AND parent = ?", (category, relative))]
+        images = [(name, CatalogStat(size, mtime)) for name, size, mtime in connection.execute(
+            "SELECT name, size, mtime_ns FROM images WHERE category = ? AND folder = ?", (category, relative))]
+        return Listing(folder, relative, mtime_ns, directories, images, {})
+
+    def read_metadata(self, folder, changed):
+        try:
+            validator = VALIDATOR_CACHE.get() if changed else None
+        except (OSError, ValueError):
+            validator = None
+        extracted = {}
+        claim = threading.Lock()
 
-    for image_path in IMAGE_PATHS:
-        if os.path.basename(image_path) == category:
-            base_folder = image_path
-            path = path if not path.startswith('/') else ''
-            path = path.replace('/', os.path.sep)
-            target_folder = os.path.join(base_folder, path)
-            combined_path = os.path.abspath(target_folder)
+        def read(item):
+            try:
+                width, height, format, text = read_image_metadata(os.path.join(folder, item[0]))
+            except Exception:
+                return None, None, None, None, None, None
+            workflow = text.pop('workflow', None)
+            other = json.dumps(text) if text else None
+            if workflow is None and other is None:
+                return width, height, format, None, None, None
+            digest = workflow_digest(workflow, other)
+            # Identical workflows are parsed once per batch, and not at all when the catalog already stores them
+            with claim:
+                claimed = digest in extracted
+                extracted.setdefault(digest, None)
+            if not claimed and self.connect().execute("SELECT 1 FROM workflows WHERE hash = ?", (digest,)).fetchone() is None:
+                try:
+                    extracted[digest] = extract_image_inputs(workflow, text.get('prompt'), validator)
+                except Exception:
+                    pass
+            return width, height, format, digest, workflow, other
+        metadata = list(self.executor.map(read, changed)) if self.executor else [read(item) for item in changed]
+        return metadata, extracted
+
+    def store_workflow(self, connection, digest, workflow, text, extracted):
+        row = connection.execute("SELECT id FROM workflows WHERE hash = ?", (digest,)).fetchone()
+        if row:
+            return row[0]
+        if extracted is None:
+            # Only when the stored copy went away after it was read, with the last image that used it
+            try:
+                prompt = json.loads(text).get('prompt') if text else None
+            except ValueError:
+                prompt = None
+            extracted = extract_image_inputs(workflow, prompt)
+        node_types, inputs, prompts = extracted
+        workflow_id = connection.execute("INSERT INTO workflows (hash, workflow, text) VALUES (?, ?, ?)", (digest, workflow, text)).lastrowid
+        connection.executemany("INSERT OR IGNORE INTO workflow_nodes VALUES (?, ?)", [(node_type, workflow_id) for node_type in node_types])
+        connection.executemany("INSERT INTO workflow_inputs VALUES (?, ?, ?, ?, ?, ?)", [(workflow_id,) + row for row in inputs])
+        if prompts and self.fts:
+            connection.execute("INSERT INTO workflow_prompts (rowid, text) VALUES (?, ?)", (workflow_id, "\n".join(prompts)))
+        return workflow_id
+
+    def write_images(self, connection, category, relative, changed, metadata, removed):
+        # Workflows are stored once per hash; the triggers drop one when its last image goes
+        metadata, extracted = metadata
+        connection.executemany("DELETE FROM images WHERE category = ? AND folder = ? AND name = ?",
+            [(category, relative, name) for name in removed])
+        for (name, stat), (width, height, format, digest, workflow, text) in zip(changed, metadata):
+            workflow_id = self.store_workflow(connection, digest, workflow, text, extracted.get(digest)) if digest else None
+            connection.execute("INSERT INTO images (category, folder, name, size, mtime_ns, width, height, format, workflow) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (category, folder, name) DO UPDATE SET size = excluded.size, mtime_ns = excluded.mtime_ns, "
+                "width = excluded.width, height = excluded.height, format = excluded.format, workflow = excluded.workflow",
+                (category, relative, name, stat.st_size, stat.st_mtime_ns, width, height, format, workflow_id))
+
+    def notify(self, category, relative, folder, changed, known, removed):
+        # New files only invalidate the listing; files the catalog already had may have stale thumbnails
+        stale = [name for name, _ in changed if name in known] + list(removed)
+        if (changed or removed) and self.on_change:
+            self.on_change(category, relative, folder, stale)
+
+    def index_folder(self, category, base, relative):
+        connection = self.connect()
+        folder = os.path.join(base, relative)
+        with self.write_lock:
+            mtime_ns = os.stat(folder).st_mtime_ns
+            directories, images = scan_directory(folder)
+            known = {name: (size, mtime) for name, size, mtime in connection.execute(
+                "SELECT name, size, mtime_ns FROM images WHERE category = ? AND folder = ?", (category, relative))}
+            changed = [(name, stat) for name, stat in images if known.get(name) != (stat.st_size, stat.st_mtime_ns)]
+            removed = list(known.keys() - {name for name, _ in images})
+            metadata = self.read_metadata(folder, changed)
+
+            prefix = relative + '/' if relative else ''
+            children = {prefix + name: stat.st_mtime_ns for name, stat in directories}
+            forgotten = []
+            with connection:
+                self.write_images(connection, category, relative, changed, metadata, removed)
+                for (child,) in connection.execute("SELECT path FROM folders WHERE category = ? AND parent = ?", (category, relative)).fetchall():
+                    if child not in children:
+                        forgotten += self.forget_folder(connection, category, child)
+                connection.executemany("INSERT INTO folders VALUES (?, ?, ?, ?, NULL) ON CONFLICT (category, path) DO UPDATE SET mtime_ns = excluded.mtime_ns",
+                    [(category, child, relative, mtime) for child, mtime in children.items()])
+                connection.execute("INSERT OR REPLACE INTO folders VALUES (?, ?, ?, ?, ?)",
+                    (category, relative, relative.rpartition('/')[0] if relative else None, mtime_ns, mtime_ns))
+        self.notify(category, relative, folder, changed, known, removed)
+        self.notify_forgotten(category, base, forgotten)
+        # Linked folders are listed but not descended into, as os.walk does, so a link back to a parent can't loop
+        return [child for child in children if not os.path.islink(os.path.join(base, child))], len(changed) + len(removed)
+
+    def index_tree(self, category, base, relative=''):
+        changes = 0
+        stack = [relative]
+        while stack and not self.stop_event.is_set():
+            relative = stack.pop()
+            try:
+                children, changed = self.index_folder(category, base, relative)
+            except OSError:
+                continue
+            changes += changed
+            stack.extend(children)
+        return changes
+
+    def update_files(self, category, base, relative, names):
+        # Applies watcher events for single files without rescanning the folder around them
+        connection = self.connect()
+        folder = os.path.join(base, relative)
+        names = sorted(names)
+        with self.write_lock:
+            try:
+                mtime_ns = os.stat(folder).st_mtime_ns
+            except OSError:
+                return 0
+            known = {}
+            for name, size, mtime in connection.execute(
+                    f"SELECT name, size, mtime_ns FROM images WHERE category = ? AND folder = ? AND name IN ({','.join('?' * len(names))})", (category, relative, *names)):
+                known[name] = (size, mtime)
+            changed = []
+            removed = []
+            for name in names:
+                try:
+                    stat = os.stat(os.path.join(folder, name))
+                except OSError:
+                    if name in known:
+                        removed.append(name)
+                    continue
+                if known.get(name) != (stat.st_size, stat.st_mtime_ns):
+                    changed.append((name, stat))
+            metadata = self.read_metadata(folder, changed)
+            with connection:
+                self.write_images(connection, category, relative, changed, metadata, removed)
+                # Only a folder that was fully indexed may be marked current again
+                connection.execute("UPDATE folders SET mtime_ns = ?, indexed_ns = ? WHERE category = ? AND path = ? AND indexed_ns IS NOT NULL",
+                    (mtime_ns, mtime_ns, category, relative))
+        self.notify(category, relative, folder, changed, known, removed)
+        return len(changed) + len(removed)
+
+    def remove_folder(self, category, base, relative):
+        connection = self.connect()
+        with self.write_lock:
+            with connection:
+                forgotten = self.forget_folder(connection, category, relative)
+        self.notify_forgotten(category, base, forgotten)
+        return len(forgotten)
+
+    def forget_folder(self, connection, category, relative):
+        # Everything under relative/ sorts between "relative/" and "relative0"
+        low, high = relative + '/', relative + '0'
+        forgotten = connection.execute("SELECT folder, name FROM images WHERE category = ? AND (folder = ? OR (folder >= ? AND folder < ?))",
+            (category, relative, low, high)).fetchall()
+        connection.execute("DELETE FROM folders WHERE category = ? AND (path = ? OR (path >= ? AND path < ?))", (category, relative, low, high))
+        connection.execute("DELETE FROM images WHERE category = ? AND (folder = ? OR (folder >= ? AND folder < ?))", (category, relative, low, high))
+        return forgotten
+
+    def notify_forgotten(self, category, base, forgotten):
+        folders = collections.defaultdict(list)
+        for relative, name in forgotten:
+            folders[relative].append(name)
+        for relative, names in folders.items():
+            self.notify(category, relative, os.path.join(base, relative), [], {}, names)
+
+    def folders(self):
+        return self.connect().execute("SELECT category, path, indexed_ns FROM folders").fetchall()
+
+    def index(self):
+        self.indexing = True
+        started = time.time()
+        changes = 0
+        categories = []
+        try:
+            for base in IMAGE_PATHS:
+                category = os.path.basename(base)
+                if not os.path.isdir(base):
+                    continue
+                categories.append(category)
+                changes += self.index_tree(category, base)
+            connection = self.connect()
+            with self.write_lock, connection:
+                marks = ",".join("?" * len(categories))
+                connection.execute(f"DELETE FROM folders WHERE category NOT IN ({marks})", categories)
+                connection.execute(f"DELETE FROM images WHERE category NOT IN ({marks})", categories)
+        finally:
+            self.indexing = False
+        self.ready = True
+        self.last_indexed = time.time()
+        if changes:
+            cstr(f"Image catalog updated {changes} images in {self.last_indexed - started:.1f}s.").msg.print()
+        return changes
+
+    def request(self, category, relative):
+        with self.lock:
+            self.pending.add((category, relative))
+        self.wake.set()
+
+    def index_pending(self):
+        with self.lock:
+            pending, self.pending = self.pending, set()
+        bases = {os.path.basename(base): base for base in IMAGE_PATHS}
+        for category, relative in pending:
+            if category not in bases or not resolve_image_path(category, relative):
+                continue
+            try:
+                self.index_folder(category, bases[category], relative)
+            except OSError:
+                continue
 
-            if not combined_path.startswith(base_folder):
-                return json.dumps(result, indent=4)
+    def run(self):
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=min(8, THUMBNAIL_WORKERS), thread_name_prefix='catalog')
+        try:
+            while not self.stop_event.is_set():
+                self.index()
+                deadline = time.monotonic() + self.interval
+                while not self.stop_event.is_set() and (self.interval <= 0 or time.monotonic() < deadline):
+                    self.wake.wait(None if self.interval <= 0 else max(0, deadline - time.monotonic()))
+                    self.wake.clear()
+                    self.index_pending()
+        finally:
+            self.executor.shutdown(wait=False)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name='image-catalog', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        self.wake.set()
+
+    def search(self, query):
+        terms = query.split()
+        clauses = ["name LIKE ? ESCAPE '\\'"] * len(terms)
+        parameters = ['%' + escape_like(term) + '%' for term in terms]
+        # Workflow matches are decided on the parsed JSON, so every image with a workflow is a candidate
+        clauses.append("workflow IS NOT NULL")
+        return self.connect().execute(
+            f"SELECT id, category, folder, name, workflow FROM images WHERE {' OR '.join(clauses)} ORDER BY category, folder, name",
+            parameters).fetchall()
+
+    def search_inputs(self, filters, terms):
+        # Every filter is an indexed lookup on workflow_nodes or workflow_inputs; the image's workflow has to satisfy all of them
+        clauses = []
+        parameters = []
+        for names, value, number in filters:
+            prefix = escape_like(value) + '%'
+            if names is None:
+                clauses.append("workflow IN (SELECT workflow FROM workflow_nodes WHERE node_type = ?)")
+                parameters.append(value)
+                continue
+            marks = ",".join("?" * len(names))
+            if number is not None:
+                clauses.append(f"workflow IN (SELECT workflow FROM workflow_inputs WHERE input IN ({marks}) AND number = ? UNION "
+                    f"SELECT workflow FROM workflow_inputs WHERE input IN ({marks}) AND number IS NULL AND value LIKE ? ESCAPE '\\')")
+                parameters += names + [number] + names + [prefix]
+            else:
+                clauses.append(f"workflow IN (SELECT workflow FROM workflow_inputs WHERE input IN ({marks}) AND value LIKE ? ESCAPE '\\' UNION "
+                    f"SELECT workflow FROM workflow_inputs WHERE input IN ({marks}) AND base LIKE ? ESCAPE '\\')")
+                parameters += names + [prefix] + names + [prefix]
+        for term in terms:
+            if self.fts:
+                clauses.append("(name LIKE ? ESCAPE '\\' OR workflow IN (SELECT rowid FROM workflow_prompts WHERE workflow_prompts MATCH ?))")
+                parameters += ['%' + escape_like(term) + '%', prompt_match_query([term])]
+            else:
+                clauses.append("name LIKE ? ESCAPE '\\'")
+                parameters.append('%' + escape_like(term) + '%')
+        return self.connect().execute(
+            f"SELECT id, category, folder, name, workflow FROM images WHERE {' AND '.join(clauses)} ORDER BY category, folder, name",
+            parameters).fetchall()
+
+    def search_prompts(self, terms):
+        # Best bm25 matches first, each with a snippet of the prompt around the matched words
+        if not self.fts or not terms:
+            return []
+        try:
+            return self.connect().execute(
+                "SELECT images.id, category, folder, name, snippet(workflow_prompts, 0, '[', ']', '...', ?) FROM workflow_prompts "
+                "JOIN images ON images.workflow = workflow_prompts.rowid WHERE workflow_prompts MATCH ? ORDER BY rank",
+                (SEARCH_SNIPPET_TOKENS, prompt_match_query(terms))).fetchall()
+        except sqlite3.OperationalError:
+            return []
+
+    def matched_inputs(self, ids, names):
+        matched = collections.defaultdict(list)
+        if names:
+            for workflow, node_type, name, value in self.connect().execute(
+                    f"SELECT workflow, node_type, input, value FROM workflow_inputs WHERE workflow IN ({','.join('?' * len(ids))}) AND input IN ({','.join('?' * len(names))})",
+                    list(ids) + list(names)):
+                matched[workflow].append({"node": node_type, "input": name, "value": value})
+        return matched
+
+    def workflows(self, ids):
+        return dict(self.connect().execute(
+            f"SELECT id, workflow FROM workflows WHERE id IN ({','.join('?' * len(ids))})", ids))
+
+    def image_workflow(self, category, relative):
+        # (size, mtime_ns, workflow) as indexed, so callers can tell whether the file changed since
+        folder, _, name = relative.rpartition('/')
+        return self.connect().execute(
+            "SELECT size, mtime_ns, workflows.workflow FROM images LEFT JOIN workflows ON workflows.id = images.workflow "
+            "WHERE category = ? AND folder = ? AND name = ?", (category, folder, name)).fetchone()
+
+    def stats(self):
+        connection = self.connect()
+        categories = {}
+        for category, images, size, workflows in connection.execute(
+                "SELECT category, COUNT(*), SUM(size), COUNT(workflow) FROM images GROUP BY category"):
+            categories[category] = {"images": images, "bytes": size, "workflows": workflows}
+        for category, folders in connection.execute("SELECT category, COUNT(*) FROM folders GROUP BY category"):
+            categories.setdefault(category, {"images": 0, "bytes": 0, "workflows": 0})["folders"] = folders
+        return {
+            "ready": self.ready,
+            "indexing": self.indexing,
+            "prompt_index": self.fts,
+            "last_indexed": self.last_indexed,
+            "categories": categories,
+            "formats": dict(connection.execute("SELECT COALESCE(format, 'unknown'), COUNT(*) FROM images GROUP BY format")),
+            "workflows": dict(zip(("distinct", "bytes"), connection.execute(
+                "SELECT COUNT(*), COALESCE(SUM(COALESCE(LENGTH(CAST(workflow AS BLOB)), 0) + COALESCE(LENGTH(CAST(text AS BLOB)), 0)), 0) FROM workflows").fetchone())),
+        }
+
+class Inotify:
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+    IN_ONLYDIR = 0x01000000
+    IN_ISDIR = 0x40000000
+    MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_ONLYDIR
+
+    def __init__(self):
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+    def add_watch(self, path):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), self.MASK)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno), path)
+        return wd
+
+    def rm_watch(self, wd):
+        self.libc.inotify_rm_watch(self.fd, wd)
+
+    def read(self, timeout):
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return []
+        data = os.read(self.fd, 65536)
+        events = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = struct.unpack_from("iIII", data, offset)
+            name = data[offset + 16:offset + 16 + length].rstrip(b'\0')
+            events.append((wd, mask, os.fsdecode(name)))
+            offset += 16 + length
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+class GalleryWatcher:
+    # Feeds file events into the catalog as they happen. Without inotify, folders are polled for mtime changes instead.
+    def __init__(self, catalog, mode=WATCH_MODE, interval=WATCH_INTERVAL):
+        self.catalog = catalog
+        self.mode = mode
+        self.interval = interval
+        self.backend = None
+        self.inotify = None
+        self.watches = {}
+        self.watched = set()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def bases(self):
+        return {os.path.basename(base): base for base in IMAGE_PATHS if os.path.isdir(base)}
+
+    def watch_tree(self, category, base, relative=''):
+        stack = [relative]
+        while stack:
+            relative = stack.pop()
+            folder = os.path.join(base, relative)
+            prefix = relative + '/' if relative else ''
+            try:
+                self.watches[self.inotify.add_watch(folder)] = (category, base, relative)
+                self.watched.add((category, relative))
+                with os.scandir(folder) as entries:
+                    stack.extend(prefix + entry.name for entry in entries if entry.is_dir(follow_symlinks=False))
+            except FileNotFoundError:
+                continue
 
+    def unwatch_tree(self, category, relative):
+        for wd, (watched_category, _, watched) in list(self.watches.items()):
+            if watched_category == category and (watched == relative or watched.startswith(relative + '/')):
+                del self.watches[wd]
+                self.watched.discard((watched_category, watched))
+                self.inotify.rm_watch(wd)
+
+    def run_inotify(self):
+        dirty = {}
+        created = []
+        deleted = []
+        first_event = None
+        while not self.stop_event.is_set():
+            events = self.inotify.read(WATCH_DEBOUNCE if first_event else 1.0)
+            for wd, mask, name in events:
+                if mask & Inotify.IN_Q_OVERFLOW:
+                    # Events were dropped; let the catalog re-check every watched folder
+                    for category, _, relative in self.watches.values():
+                        self.catalog.request(category, relative)
+                    continue
+                if mask & Inotify.IN_IGNORED:
+                    category, _, relative = self.watches.pop(wd, (None, None, None))
+                    self.watched.discard((category, relative))
+                    continue
+                if wd not in self.watches:
+                    continue
+                category, base, relative = self.watches[wd]
+                child = relative + '/' + name if relative else name
+                if mask & Inotify.IN_ISDIR:
+                    if mask & (Inotify.IN_CREATE | Inotify.IN_MOVED_TO):
+                        created.append((category, base, child))
+                    elif mask & (Inotify.IN_DELETE | Inotify.IN_MOVED_FROM):
+                        deleted.append((category, base, child))
+                    dirty.setdefault((category, base, relative), set())
+                elif mask & Inotify.IN_CREATE:
+                    # Wait for the close; a file that is still being written can't be read yet
+                    continue
+                elif os.path.splitext(name)[1].lower() in ALLOWED_EXTENSIONS:
+                    dirty.setdefault((category, base, relative), set()).add(name)
+                first_event = first_event or time.monotonic()
+            # Flush once events go quiet, or every second while ComfyUI keeps writing
+            if first_event and (not events or time.monotonic() - first_event > 1.0):
+                for category, base, relative in deleted:
+                    self.unwatch_tree(category, relative)
+                    self.catalog.remove_folder(category, base, relative)
+                for category, base, relative in created:
+                    try:
+                        self.watch_tree(category, base, relative)
+                    except OSError:
+                        pass
+                    self.catalog.index_tree(category, base, relative)
+                for (category, base, relative), names in dirty.items():
+                    self.catalog.update_files(category, base, relative, names)
+                dirty.clear()
+                created = []
+                deleted = []
+                first_event = None
+
+    def run_poll(self):
+        while not self.stop_event.wait(self.interval):
+            bases = self.bases()
+            for category, relative, indexed_ns in self.catalog.folders():
+                if category not in bases or self.stop_event.is_set():
+                    continue
+                try:
+                    mtime_ns = os.stat(os.path.join(bases[category], relative)).st_mtime_ns
+                except FileNotFoundError:
+                    # The parent's mtime moved as well, reindexing it forgets this folder
+                    continue
+                except OSError:
+                    continue
+                if mtime_ns != indexed_ns:
+                    try:
+                        self.catalog.index_folder(category, bases[category], relative)
+                    except OSError:
+                        continue
+
+    def run(self):
+        if self.backend == "inotify":
             try:
-                if not path or path == "":
-                    for item in os.listdir(image_path):
-                        item_path = os.path.join(image_path, item)
-                        if os.path.isdir(item_path):
-                            relative_path = os.path.relpath(item_path, base_folder).replace("\\", "/")
-                            result["directories"].append(relative_path)
-                        else:
-                            if os.path.splitext(item)[1] in ['.png', '.webp', '.jpg', '.jpeg', '.gif']:
-                                image_relative_path = os.path.join(path, item).replace("\\", "/")
-                                result["images"].append(image_relative_path)
-                else:
-                    for item in os.listdir(combined_path):
-                        item_path = os.path.join(combined_path, item)
-                        if os.path.isdir(item_path):
-                            relative_path = os.path.relpath(item_path, base_folder).replace("\\", "/")
-                            result["directories"].append(relative_path)
+                for category, base in self.bases().items():
+                    self.watch_tree(category, base)
+            except OSError as e:
+                # Usually the fs.inotify.max_user_watches limit
+                cstr(f"Unable to watch gallery folders with inotify ({e}), polling for changes instead.").warning.print()
+                self.inotify.close()
+                self.inotify = None
+                self.watches = {}
+                self.watched = set()
+                self.backend = "poll"
+        try:
+            if self.backend == "inotify":
+                self.run_inotify()
+            else:
+                self.run_poll()
+        except Exception as e:
+            cstr("The gallery watcher stopped unexpectedly.").error.print()
+            print(e)
+        finally:
+            if self.inotify:
+                self.inotify.close()
+
+    def start(self):
+        self.backend = "poll"
+        if self.mode == "auto" and sys.platform.startswith('linux'):
+            try:
+                self.inotify = Inotify()
+                self.backend = "inotify"
+            except (OSError, AttributeError):
+                cstr("inotify is unavailable, polling gallery folders for changes instead.").warning.print()
+        self.thread = threading.Thread(target=self.run, name='gallery-watcher', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def watching(self, category, relative):
+        # Only inotify sees files rewritten in place; polling just compares folder mtimes, and linked folders aren't watched
+        return self.backend == "inotify" and self.thread is not None and self.thread.is_alive() and (category, relative) in self.watched
+
+    def stats(self):
+        return {
+            "backend": self.backend,
+            "watches": len(self.watches),
+        }
+
+def thumbnail_key(full_path, stat, size="grid", format="jpeg"):
+    return hashlib.sha1(f"{full_path}|{stat.st_size}|{stat.st_mtime_ns}|{size}|{format}".encode('utf-8')).hexdigest()
+
+def has_image_feature(feature):
+    try:
+        return features.check(feature)
+    except ValueError:
+        return False
+
+THUMBNAIL_ENCODERS = ["jpeg"] + [format for format in ("webp", "avif") if has_image_feature(format)]
+
+def negotiate_thumbnail_format(accept, requested=None):
+    if requested in THUMBNAIL_ENCODERS and (requested != "avif" or THUMBNAIL_AVIF):
+        return requested
+    accept = accept or ''
+    if THUMBNAIL_AVIF and 'image/avif' in accept and "avif" in THUMBNAIL_ENCODERS:
+        return "avif"
+    if 'image/webp' in accept and "webp" in THUMBNAIL_ENCODERS:
+        return "webp"
+    return "jpeg"
+
+class ThumbnailCache:
+    # The index is a snapshot plus an append-only journal of puts and removals. A put appends one line; the snapshot is
+    # only rewritten once the journal outgrows it, after a prune and at shutdown.
+    JOURNAL_MIN = 1000
+
+    def __init__(self, directory, max_bytes=THUMBNAIL_CACHE_MAX_BYTES, max_entries=THUMBNAIL_CACHE_MAX_ENTRIES):
+        self.directory = directory
+        self.index_path = os.path.join(directory, 'thumbnails.json')
+        self.journal_path = os.path.join(directory, 'thumbnails.log')
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.save_lock = threading.Lock()
+        # key -> [source, size, last access], kept in least recently used order
+        self.entries = collections.OrderedDict()
+        self.sources = {}
+        self.total_bytes = 0
+        self.journal_file = None
+        self.journaled = 0
+        self.dirty = False
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as file:
+                entries = json.load(file)
+        except (OSError, ValueError):
+            entries = {}
+        for key, entry in sorted(entries.items(), key=lambda item: item[1][2] if len(item[1]) > 2 else 0):
+            self.add_entry(key, entry[0], entry[1], entry[2] if len(entry) > 2 else 0)
+        # A journal set aside by a save that didn't finish comes before the current one
+        for path in (self.journal_path + '.old', self.journal_path):
+            try:
+                with open(path, 'r', encoding='utf-8') as file:
+                    for line in file:
+                        record = json.loads(line)
+                        if record[0] == 'put':
+                            self.add_entry(*record[1:])
                         else:
-                            if os.path.splitext(item)[1] in ['.png', '.webp', '.jpg', '.jpeg', '.gif']:
-                                image_relative_path = os.path.join(path, item).replace("\\", "/")
-                                result["images"].append(image_relative_path)
-            except Exception as e:
-                cstr(f"There was an error with a path request for category `{category}` and path `{path}`").error.print()
-                print(e)
+                            self.remove_entry(record[1])
+                        self.journaled += 1
+            except (OSError, ValueError, IndexError, TypeError):
+                # Missing, or cut short by a crash mid-write
+                continue
 
-            break
-        
-        if result['directories']:
-            result['directories'] = sorted(result['directories'])
-        if result['images']:
-            result['images'] = sorted(result['images'])
+    def journal(self, records):
+        # Called with the lock held
+        try:
+            if self.journal_file is None:
+                self.journal_file = open(self.journal_path, 'a', encoding='utf-8')
+            self.journal_file.write(''.join(json.dumps(record) + '\n' for record in records))
+            self.journal_file.flush()
+            self.journaled += len(records)
+        except OSError:
+            self.dirty = True
+
+    def save(self):
+        old_path = self.journal_path + '.old'
+        with self.save_lock:
+            with self.lock:
+                if not self.journaled and not self.dirty:
+                    return
+                entries = dict(self.entries)
+                self.journaled = 0
+                self.dirty = False
+                # Records written from here on go to a fresh journal; the one set aside stays until the snapshot is in place
+                if self.journal_file is not None:
+                    self.journal_file.close()
+                    self.journal_file = None
+                try:
+                    if os.path.exists(old_path):
+                        with open(self.journal_path, 'rb') as source, open(old_path, 'ab') as target:
+                            shutil.copyfileobj(source, target)
+                        os.remove(self.journal_path)
+                    else:
+                        os.replace(self.journal_path, old_path)
+                except FileNotFoundError:
+                    pass
+            fd, temp_path = tempfile.mkstemp(dir=self.directory, prefix='.thumbnails', suffix='.tmp')
+            with os.fdopen(fd, 'w', encoding='utf-8') as file:
+                json.dump(entries, file)
+            os.replace(temp_path, self.index_path)
+            try:
+                os.remove(old_path)
+            except FileNotFoundError:
+                pass
+
+    def path(self, key):
+        # Shard by key prefix so no single directory holds the whole cache
+        return os.path.join(self.directory, key[:2], key + '.thumb')
+
+    def add_entry(self, key, source, size, accessed):
+        self.remove_entry(key)
+        self.entries[key] = [source, size, accessed]
+        self.sources.setdefault(source, set()).add(key)
+        self.total_bytes += size
+
+    def remove_entry(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return None
+        self.total_bytes -= entry[1]
+        keys = self.sources.get(entry[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self.sources[entry[0]]
+        return entry
+
+    def remove_file(self, key):
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
 
-    return json.dumps(result)
+    def get(self, key):
+        # The file name is derived from the key, so a missing index entry only costs a failed open
+        try:
+            with open(self.path(key), 'rb') as thumbnail_file:
+                data = thumbnail_file.read()
+        except FileNotFoundError:
+            with self.lock:
+                if self.remove_entry(key) is not None:
+                    self.journal([["remove", key]])
+            return None
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                entry[2] = time.time()
+                self.entries.move_to_end(key)
+                self.dirty = True
+        return data
+
+    def put(self, key, source, data):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.' + key, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as thumbnail_file:
+            thumbnail_file.write(data)
+        os.replace(temp_path, path)
+        with self.lock:
+            accessed = time.time()
+            self.add_entry(key, source, len(data), accessed)
+            evicted = []
+            while self.entries and (self.total_bytes > self.max_bytes or len(self.entries) > self.max_entries):
+                evicted.append(next(iter(self.entries)))
+                self.remove_entry(evicted[-1])
+            self.journal([["put", key, source, len(data), accessed]] + [["remove", evicted_key] for evicted_key in evicted])
+            # Compacting once the journal is as long as the index keeps the bytes written linear in the puts
+            save = self.journaled >= max(self.JOURNAL_MIN, len(self.entries))
+        for evicted_key in evicted:
+            self.remove_file(evicted_key)
+        if save:
+            self.save()
+
+    def evict_source(self, source):
+        with self.lock:
+            keys = list(self.sources.get(source, ()))
+            for key in keys:
+                self.remove_entry(key)
+            if keys:
+                self.journal([["remove", key] for key in keys])
+        for key in keys:
+            self.remove_file(key)
+        return keys
+
+    def prune(self):
+        # Drop thumbnails of deleted images, then files the index no longer knows about
+        with self.lock:
+            sources = list(self.sources.keys())
+        removed = 0
+        for source in sources:
+            if source and not os.path.exists(source):
+                removed += len(evict_thumbnails(source))
+
+        legacy = re.compile(r'^.+_[0-9a-f]{64}\.(png|jpg|jpeg|gif|webp)$', re.IGNORECASE)
+        shard = re.compile(r'^[0-9a-f]{2}$')
+        cutoff = time.time() - 60
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and legacy.match(entry.name):
+                os.remove(entry.path)
+                removed += 1
+            elif entry.is_dir() and shard.match(entry.name):
+                for thumbnail in os.scandir(entry.path):
+                    key = thumbnail.name.split('.')[0]
+                    with self.lock:
+                        known = key in self.entries
+                    if not known and thumbnail.stat().st_mtime < cutoff:
+                        os.remove(thumbnail.path)
+                        removed += 1
+        self.save()
+        return removed
+
+class MemoryCache:
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.entries = collections.OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            data = self.entries.get(key)
+            if data is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return data
+
+    def put(self, key, data):
+        if len(data) > self.max_bytes:
+            return
+        with self.lock:
+            previous = self.entries.pop(key, None)
+            if previous is not None:
+                self.total_bytes -= len(previous)
+            self.entries[key] = data
+            self.total_bytes += len(data)
+            while self.total_bytes > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.total_bytes -= len(evicted)
+
+    def pop(self, key):
+        with self.lock:
+            data = self.entries.pop(key, None)
+            if data is not None:
+                self.total_bytes -= len(data)
+            return data
+
+    def stats(self):
+        return {
+            "entries": len(self.entries),
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+class StatCache:
+    # Trusts a source image's stat for a few seconds so hot thumbnails are served without touching the disk
+    def __init__(self, ttl=THUMBNAIL_STAT_TTL, max_entries=65536):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.entries = collections.OrderedDict()
+
+    def stat(self, full_path):
+        now = time.monotonic()
+        with self.lock:
+            cached = self.entries.get(full_path)
+            if cached is not None and now - cached[1] < self.ttl:
+                return cached[0]
+        stat = os.stat(full_path)
+        with self.lock:
+            self.entries[full_path] = (stat, now)
+            self.entries.move_to_end(full_path)
+            if len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return stat
+
+    def pop(self, full_path):
+        with self.lock:
+            self.entries.pop(full_path, None)
+
+def evict_thumbnails(full_path):
+    keys = THUMBNAIL_CACHE.evict_source(full_path)
+    for key in keys:
+        THUMBNAIL_MEMORY.pop(key)
+    THUMBNAIL_STATS.pop(full_path)
+    return keys
+
+def invalidate_gallery_folder(category, relative, folder, names):
+    LISTING_CACHE.pop(category, relative)
+    for name in names:
+        evict_thumbnails(os.path.join(folder, name))
+
+def render_thumbnail(full_path, size="grid", format="jpeg"):
+    # Runs in a worker process; must stay a picklable top-level function
+    target_width, target_height = THUMBNAIL_SIZES[size]
+    image = Image.open(full_path)
 
-def compress_image(category, path):
-    full_path = get_full_path(category, path)
-    if full_path:
-        with open(full_path, "rb") as image_file:
-            image_data = image_file.read()
-        
-        thumbnail_filename = os.path.basename(full_path)
-        thumbnail_extension = os.path.splitext(thumbnail_filename)[1]
-        hash_object = hashlib.sha256(image_data)
-        hash_hex = hash_object.hexdigest()
-        cleaned_hash = re.sub(r"[^a-zA-Z0-9]", "", hash_hex)
-        thumbnail_filename = f"{thumbnail_filename}_{cleaned_hash}{thumbnail_extension}"
-        thumbnail_path = os.path.join(THUMBNAIL_DIRECTORY, thumbnail_filename)
-
-        if os.path.exists(thumbnail_path):
-            with open(thumbnail_path, "rb") as thumbnail_file:
-                return thumbnail_file.read()
-
-        image = Image.open(full_path)
-
-        if image.mode != "RGB":
-            image = image.convert("RGB")
-
-        width, height = image.size
-        aspect_ratio = min(200 / width, 400 / height)
-        new_width = int(width * aspect_ratio)
-        new_height = int(height * aspect_ratio)
-        resized_image = image.resize((new_width, new_height), Image.Resampling(1))
-        output_buffer = io.BytesIO()
-        resized_image.save(output_buffer, "JPEG", quality=90)
-        compressed_bytes = output_buffer.getvalue()
-        output_buffer.close()
-
-        with open(thumbnail_path, "wb") as thumbnail_file:
-            thumbnail_file.write(compressed_bytes)
-
-        return compressed_bytes
-        
-    return b''
+    # JPEG can decode straight at 1/2, 1/4 or 1/8 scale
+    if image.format == "JPEG":
+        image.draft("RGB", (target_width, target_height))
+
+    keep_alpha = format != "jpeg" and (image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info))
+    mode = "RGBA" if keep_alpha else "RGB"
+    if image.mode != mode:
+        image = image.convert(mode)
+
+    width, height = image.size
+    aspect_ratio = min(target_width / width, target_height / height, 1.0)
+    new_width = max(1, int(width * aspect_ratio))
+    new_height = max(1, int(height * aspect_ratio))
+
+    # Cheap box reduction to within 2x of the target, then a quality resample for the rest
+    factor = min(width // new_width, height // new_height) // 2
+    if factor >= 2:
+        image = image.reduce(factor)
+    if image.size != (new_width, new_height):
+        image = image.resize((new_width, new_height), Image.Resampling(1))
+
+    pil_format, _, options = THUMBNAIL_FORMATS[format]
+    output_buffer = io.BytesIO()
+    image.save(output_buffer, pil_format, **options)
+    compressed_bytes = output_buffer.getvalue()
+    output_buffer.close()
+
+    return compressed_bytes
+
+class ThumbnailWorkers:
+    def __init__(self, workers=THUMBNAIL_WORKERS):
+        self.workers = max(1, workers)
+        self.pool = None
+        self.semaphore = None
+
+    def start(self):
+        # Spawned workers avoid forking a process that already runs background threads
+        self.pool = concurrent.futures.ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'))
+
+    async def render(self, full_path, size="grid", format="jpeg"):
+        if self.semaphore is None:
+            # Backpressure: at most two jobs per worker are handed to the pool, the rest wait here
+            self.semaphore = asyncio.Semaphore(self.workers * 2)
+        async with self.semaphore:
+            if self.pool is None:
+                self.start()
+            try:
+                return await asyncio.get_running_loop().run_in_executor(self.pool, render_thumbnail, full_path, size, format)
+            except concurrent.futures.process.BrokenProcessPool:
+                cstr("The thumbnail worker pool stopped unexpectedly and will be restarted.").error.print()
+                self.pool = None
+                raise
+
+    def shutdown(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            self.pool = None
+
+THUMBNAIL_INFLIGHT = {}
+
+async def render_and_cache(key, full_path, size, format):
+    compressed_bytes = await THUMBNAIL_WORKERS_POOL.render(full_path, size, format)
+    THUMBNAIL_MEMORY.put(key, compressed_bytes)
+    await asyncio.get_running_loop().run_in_executor(None, THUMBNAIL_CACHE.put, key, full_path, compressed_bytes)
+    return compressed_bytes
+
+def locate_thumbnail(category, path, size="grid", format="jpeg"):
+    full_path = resolve_image_path(category, path)
+    try:
+        stat = THUMBNAIL_STATS.stat(full_path) if full_path else None
+    except OSError:
+        stat = None
+    if not stat:
+        cstr(f"Unable to find image for category `{category}` and path `{path}`").error.print()
+        return None
+    return full_path, stat, thumbnail_key(full_path, stat, size, format)
+
+async def load_thumbnail(full_path, key, size="grid", format="jpeg"):
+    # Only the memory tier is read on the event loop; the disk tier is a file read like any other
+    cached = THUMBNAIL_MEMORY.get(key)
+    if cached is not None:
+        return cached
+    cached = await asyncio.get_running_loop().run_in_executor(None, THUMBNAIL_CACHE.get, key)
+    if cached is not None:
+        THUMBNAIL_MEMORY.put(key, cached)
+        return cached
+
+    # Single-flight: concurrent requests for the same thumbnail share one render
+    task = THUMBNAIL_INFLIGHT.get(key)
+    if task is None:
+        task = asyncio.ensure_future(render_and_cache(key, full_path, size, format))
+        THUMBNAIL_INFLIGHT[key] = task
+        task.add_done_callback(lambda _: THUMBNAIL_INFLIGHT.pop(key, None))
+
+    try:
+        # Shielded so one client disconnecting does not cancel the render for the others
+        return await asyncio.shield(task)
+    except Exception as e:
+        cstr(f"Unable to create a thumbnail for `{full_path}`").error.print()
+        print(e)
+        return None
+
+async def compress_image(category, path, size="grid", format="jpeg"):
+    located = await asyncio.get_running_loop().run_in_executor(None, locate_thumbnail, category, path, size, format)
+    if not located:
+        return None
+    full_path, _, key = located
+    return await load_thumbnail(full_path, key, size, format)
     
+def find_recent_images(paths, count):
+    recent = []
+    stack = [path for path in paths if os.path.isdir(path)]
+    while stack:
+        try:
+            with os.scandir(stack.pop()) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir():
+                            if not entry.is_symlink():
+                                stack.append(entry.path)
+                        elif os.path.splitext(entry.name)[1].lower() in ALLOWED_EXTENSIONS:
+                            stat = entry.stat()
+                            item = (stat.st_mtime_ns, entry.path, stat)
+                            if len(recent) < count:
+                                heapq.heappush(recent, item)
+                            elif item[0] > recent[0][0]:
+                                heapq.heapreplace(recent, item)
+                    except OSError:
+                        continue
+        except OSError:
+            continue
+    return [(path, stat) for _, path, stat in sorted(recent, reverse=True)]
+
+class ThumbnailPrefetcher:
+    def __init__(self, workers=max(1, THUMBNAIL_WORKERS // 2), limit=THUMBNAIL_PREFETCH_LIMIT):
+        # Fewer prefetch tasks than render slots, so requests for visible images always find one free
+        self.workers = workers
+        self.limit = limit
+        self.queue = None
+        self.tasks = []
+        self.queued = set()
+        self.sequence = 0
+        self.generation = 0
+        # What a current browser's <img> request negotiates, for listings that don't name a format
+        self.format = negotiate_thumbnail_format("image/avif,image/webp,image/*")
+        self.warm_keys = set()
+        self.warm = {"total": 0, "done": 0, "skipped": 0, "finished": None}
+
+    def start(self):
+        self.queue = asyncio.PriorityQueue()
+        self.tasks = [asyncio.ensure_future(self.run()) for _ in range(self.workers)]
+
+    def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        self.tasks = []
+
+    def put(self, priority, full_path, key, size, format):
+        if key in self.queued or key in THUMBNAIL_INFLIGHT or len(self.queued) >= self.limit:
+            return False
+        self.sequence += 1
+        self.queued.add(key)
+        # Lower level first, then the most recent listing, then display order
+        self.queue.put_nowait(((priority, -self.generation, self.sequence), full_path, key, size, format))
+        return True
+
+    @staticmethod
+    def missing_thumbnails(images, size, format):
+        # Runs in an executor: hashing keys and probing the disk cache for a whole listing would stall the loop
+        missing = []
+        for priority, full_path, stat in images:
+            key = thumbnail_key(full_path, stat, size, format)
+            if not os.path.exists(THUMBNAIL_CACHE.path(key)):
+                missing.append((priority, full_path, key))
+        return missing
+
+    @classmethod
+    def listing_thumbnails(cls, listing, result, subfolders, format):
+        stats = dict(listing.images)
+        prefix = listing.relative + '/' if listing.relative else ''
+        images = []
+        for image in result["images"]:
+            name = image["path"][len(prefix):]
+            images.append((1, os.path.join(listing.folder, name), stats[name]))
+        recent = sorted(listing.directories, key=lambda item: item[1].st_mtime_ns, reverse=True)[:subfolders]
+        for name, _ in recent:
+            folder = os.path.join(listing.folder, name)
+            try:
+                _, children = scan_directory(folder)
+            except OSError:
+                continue
+            images += [(2, os.path.join(folder, child), stat) for child, stat in sorted(children)]
+        return cls.missing_thumbnails(images, "grid", format)
+
+    async def run(self):
+        while True:
+            _, full_path, key, size, format = await self.queue.get()
+            try:
+                await load_thumbnail(full_path, key, size, format)
+            except Exception:
+                pass
+            finally:
+                self.queued.discard(key)
+                self.queue.task_done()
+                if key in self.warm_keys:
+                    self.warm_keys.discard(key)
+                    self.warm_progress()
+
+    def warm_progress(self, skipped=False):
+        self.warm["skipped" if skipped else "done"] += 1
+        done, total = self.warm["done"], self.warm["total"]
+        if done + self.warm["skipped"] == total:
+            self.warm["finished"] = time.time()
+            cstr(cstr.color.LIGHTGREEN + f"Thumbnail cache warmed with {done} recent images." + cstr.color.END).msg.print()
+            if self.warm["skipped"]:
+                cstr(f"{self.warm['skipped']} recent images were not warmed: the prefetch queue was full or they were already being rendered.").warning.print()
+        elif not skipped and done % max(1, total // 10) == 0:
+            cstr(f"Warming thumbnail cache: {done}/{total}").msg.print()
+
+    async def warm_cache(self, count):
+        images = await asyncio.get_running_loop().run_in_executor(None, find_recent_images, IMAGE_PATHS, count)
+        self.warm.update({"total": len(images), "done": 0, "skipped": 0, "finished": None if images else time.time()})
+        cstr(f"Warming thumbnail cache with the {len(images)} most recent images.").msg.print()
+        missing = await asyncio.get_running_loop().run_in_executor(None, self.missing_thumbnails,
+            [(3, full_path, stat) for full_path, stat in images], "grid", self.format)
+        for _ in range(len(images) - len(missing)):
+            self.warm_progress()
+        for priority, full_path, key in missing:
+            # Only cached thumbnails count as warmed; one a listing already queued is counted when it renders
+            if self.put(priority, full_path, key, "grid", self.format) or key in self.queued:
+                self.warm_keys.add(key)
+            else:
+                self.warm_progress(skipped=True)
+
+    async def enqueue_listing(self, listing, result, format=None, subfolders=None):
+        subfolders = THUMBNAIL_PREFETCH_SUBFOLDERS if subfolders is None else subfolders
+        format = format or self.format
+        if listing is None or self.queue is None:
+            return 0
+        self.generation += 1
+        missing = await asyncio.get_running_loop().run_in_executor(None, self.listing_thumbnails, listing, result, subfolders, format)
+        return sum(self.put(priority, full_path, key, "grid", format) for priority, full_path, key in missing)
+
 import inspect
 
 def scrape_classes():
@@ -426,6 +2696,18 @@ def scrape_classes():
     window_title(TITLE)
     return classes
 
+
+def build_dictionary():
+    global DB_CACHED
+    if ( UPDATE_CLASSES and not DB_CACHED ) or not os.path.exists(DB_FILE):
+        DB_CACHED = True
+        cstr(cstr.color.LIGHTYELLOW + "Building dictionary database." + cstr.color.END).msg.print()
+        classes = scrape_classes()
+        fd, temp_path = tempfile.mkstemp(dir=ROOT, prefix='.explorer_dictionary', suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(classes, f, ensure_ascii=False)
+        os.replace(temp_path, DB_FILE)
+        cstr(cstr.color.LIGHTGREEN + "Dictionary database built." + cstr.color.END).msg.print()
     
 # Setup CSS Colors
 COLORS = get_color_palettes(CP_FILE)
@@ -466,23 +2748,24 @@ dark_css_colors += f"\t\t\t--link-color: {COLORS['dark']['colors']['litegraph_ba
 dark_css_colors += f"\t\t\t--event-link-color: {COLORS['dark']['colors']['litegraph_base']['EVENT_LINK_COLOR']};\n"
 dark_css_colors += f"\t\t\t--connecting-link-color: {COLORS['dark']['colors']['litegraph_base']['CONNECTING_LINK_COLOR']};\n"
 
+# CACHES
+DICTIONARY_CACHE = JSONFileCache(DB_FILE)
+PLIST_CACHE = JSONFileCache(PFILE)
+PLUGIN_INDEX_CACHE = PluginIndexCache(PLIST_CACHE)
+NODE_INDEX_CACHE = NodeIndexCache(DICTIONARY_CACHE, PLUGIN_INDEX_CACHE, JSONFileCache(NODE_MAP_FILE))
+VALIDATOR_CACHE = WorkflowValidatorCache(DICTIONARY_CACHE)
+LISTING_CACHE = ListingCache()
+CATALOG = None
+GALLERY_WATCHER = None
+
 # ROUTE FUNCTIONS
 
 # GET NODE CLASSES
 async def get_node_classes(request):
-    global DB_CACHED
-    classes = {}
     try:
-        if ( UPDATE_CLASSES and not DB_CACHED ) or not os.path.exists(os.path.join(ROOT, 'explorer_dictionary.json')):
-            DB_CACHED = True
-            cstr(cstr.color.LIGHTYELLOW + "Building dictionary database." + cstr.color.END).msg.print()
-            classes = scrape_classes()   
-            with open(os.path.join(ROOT, 'explorer_dictionary.json'), 'w', encoding='utf-8') as f:
-                json.dump(classes, f, ensure_ascii=False)
-            cstr(cstr.color.LIGHTGREEN + "Dictionary database built." + cstr.color.END).msg.print()
-        else:
-            with open(os.path.join(ROOT, 'explorer_dictionary.json'), 'r', encoding='utf-8') as f:
-                classes = json.load(f)
+        build_dictionary()
+        entry = await asyncio.get_running_loop().run_in_executor(None, DICTIONARY_CACHE.get)
+        return cached_json_response(request, entry)
     except OSError as e:
         cstr("There was a problem building or loading the dictionary database.").error.print()
         print(e)
@@ -491,40 +2774,17 @@ async def get_node_classes(request):
         cstr("There was a general error when dealing with the dictionary database.").error.print()
         print(e)
         traceback.print_exc();
-    
-    try:
-        if NO_SOURCE_CODE:
-            for category, category_classes, category_manifest in classes.items():
-                for class_name, class_details in category_classes.items():
-                    if 'source_code' in class_details:
-                        classes[category]["classes"][class_name]['source_code'] = None
-            with open(os.path.join(ROOT, 'explorer_dictionary.json'), 'w', encoding='utf-8') as f:
-                json.dump(classes, f, ensure_ascii=False)
-    except Exception as e:
-        print(e)
-        traceback.print_exc();
         
-    return web.Response(text=json.dumps(classes), content_type='application/json')
+    return web.Response(text=json.dumps({}), content_type='application/json')
     
 # GET COMFYUI MANAGER PLUGINS    
 async def get_plugin_list(request):
-    global PLIST_CACHED
-    plugins = {}
-    if not NO_PLIST:
+    if not NO_PLIST and os.path.exists(PFILE):
         try:
-            if ( UPDATE_PLIST and not PLIST_CACHED ) and not os.path.exists(os.path.join(ROOT, 'custom-node-list.json')):
-                if not IS_ONLINE:
-                    cstr("Unable to download ComfyUI Manager plugin list while offline.").error.print()
-                    return web.Response(text=json.dumps({}), content_type='application/json')
-                PLIST_CACHED = True
-                cstr(cstr.color.LIGHTYELLOW + "Downloading ComfyUI Manager plugin list." + cstr.color.END).msg.print()
-                fetch_plist()
-                plugins = load_plist()   
-                cstr(cstr.color.LIGHTGREEN + "Download complete." + cstr.color.END).msg.print()
-            else:
-                plugins = load_plist()
+            entry = await asyncio.get_running_loop().run_in_executor(None, PLIST_CACHE.get)
+            return cached_json_response(request, entry)
         except OSError as e:
-            cstr("There was a problem building or loading the plugin list.").error.print()
+            cstr("There was a problem loading the plugin list.").error.print()
             print(e)
             traceback.print_exc();
         except Exception as e:
@@ -532,8 +2792,92 @@ async def get_plugin_list(request):
             print(e)
             traceback.print_exc();
         
-    return web.Response(text=json.dumps(plugins), content_type='application/json')
+    return web.Response(text=json.dumps({}), content_type='application/json')
+
+# GET INSTALLED COMFYUI MANAGER PLUGINS
+async def get_installed_plugins(request):
+    if not NO_PLIST and os.path.exists(PFILE):
+        try:
+            entry = await asyncio.get_running_loop().run_in_executor(None, PLUGIN_INDEX_CACHE.get)
+            return cached_json_response(request, entry)
+        except Exception as e:
+            cstr("There was a general error when cross referencing installed packages with the plugin list.").error.print()
+            print(e)
+            traceback.print_exc();
+
+    return web.Response(text=json.dumps({"installed": {}, "missing": [], "unlisted": []}), content_type='application/json')
+
+
+# RESOLVE WORKFLOW NODE TYPES
+async def resolve_workflow(request):
+    try:
+        workflow = await request.json()
+    except ValueError:
+        return web.Response(text="Request body must be a workflow JSON", status=400)
+
+    if isinstance(workflow, dict) and isinstance(workflow.get('types'), list):
+        node_types = workflow['types']
+    else:
+        node_types = get_workflow_node_types(workflow.get('workflow', workflow) if isinstance(workflow, dict) else workflow)
+
+    try:
+        build_dictionary()
+        index = await asyncio.get_running_loop().run_in_executor(None, NODE_INDEX_CACHE.get)
+    except Exception as e:
+        cstr("There was a general error when building the node class index.").error.print()
+        print(e)
+        traceback.print_exc();
+        return web.Response(text=json.dumps({}), content_type='application/json', status=500)
+
+    return web.Response(text=json.dumps(index.resolve(node_types)), content_type='application/json')
+
+# VALIDATE WORKFLOWS
+async def validate_workflows(request):
+    try:
+        body = await request.json()
+    except ValueError:
+        return web.Response(text="Request body must be JSON", status=400)
+
+    workflows = []
+    images = []
+    if isinstance(body, list):
+        workflows = [(str(index), workflow) for index, workflow in enumerate(body)]
+    elif isinstance(body, dict) and ('workflows' in body or 'images' in body):
+        if isinstance(body.get('workflows'), dict):
+            workflows = list(body['workflows'].items())
+        elif isinstance(body.get('workflows'), list):
+            workflows = [(str(index), workflow) for index, workflow in enumerate(body['workflows'])]
+        images = [image for image in body.get('images') or [] if isinstance(image, dict)]
+    else:
+        workflows = [("0", body)]
+
+    def run():
+        validator = VALIDATOR_CACHE.get()
+        report = validator.validate_batch(workflows)
+        if images:
+            paths = {}
+            for image in images:
+                full_path = get_full_path(image.get('category'), image.get('path', ''))
+                if full_path:
+                    paths[full_path] = f"{image.get('category')}/{image.get('path')}"
+            image_report = validate_workflow_paths(validator, list(paths.keys()))
+            for result in image_report["results"]:
+                result["name"] = paths.get(result["name"], result["name"])
+            report["results"].extend(image_report["results"])
+            for key in report["summary"]:
+                report["summary"][key] += image_report["summary"][key]
+        return report
+
+    try:
+        build_dictionary()
+        report = await asyncio.get_running_loop().run_in_executor(None, run)
+    except Exception as e:
+        cstr("There was a general error while validating workflows.").error.print()
+        print(e)
+        traceback.print_exc();
+        return web.Response(text=json.dumps({}), content_type='application/json', status=500)
 
+    return web.Response(text=json.dumps(report), content_type='application/json')
 
 # GET DIRECTORY PATHS
 async def get_directory(request):
@@ -546,8 +2890,24 @@ async def get_directory(request):
         cstr("A request for folder paths is being made without query paramters.").warning.print()
         return web.Response(text="Missing query parameters 'category' or 'path'", status=400)
 
-    json_result = get_paths(category, path)
-    return web.json_response(json_result)
+    sort = request.query.get("sort", "name")
+    order = request.query.get("order", "asc")
+    if sort not in GALLERY_SORT_KEYS or order not in ("asc", "desc"):
+        return web.Response(text=f"Unknown sort '{sort}' or order '{order}'", status=400)
+    try:
+        offset = max(0, int(request.query.get("offset", 0)))
+        limit = max(0, int(request.query.get("limit", 0)))
+    except ValueError:
+        return web.Response(text="Query parameters 'offset' and 'limit' must be integers", status=400)
+    # Thumbnails are prefetched in the format this client's image requests will ask for
+    format = request.query.get("format")
+    if format is not None and format not in THUMBNAIL_ENCODERS:
+        return web.Response(text=f"Unknown thumbnail format '{format}'", status=400)
+
+    listing = await asyncio.get_running_loop().run_in_executor(None, LISTING_CACHE.get, category, path)
+    result = get_paths(listing, offset, limit, sort, order)
+    asyncio.ensure_future(THUMBNAIL_PREFETCH.enqueue_listing(listing, result, format))
+    return web.json_response(result)
   
 # GET IMAGE THUMBNAIL  
 async def get_image(request):
@@ -555,9 +2915,37 @@ async def get_image(request):
     path = request.query.get("path")
     category = urllib.parse.unquote(category) if category else None
     path = urllib.parse.unquote(path) if path else None
-    compressed_bytes = compress_image(category, path)
-    response = web.StreamResponse()
-    response.content_type = 'image/jpeg'
+    size = request.query.get("size", "grid")
+    if size not in THUMBNAIL_SIZES:
+        return web.Response(text=f"Unknown thumbnail size '{size}'", status=400)
+    format = negotiate_thumbnail_format(request.headers.get('Accept'), request.query.get("format"))
+
+    located = await asyncio.get_running_loop().run_in_executor(None, locate_thumbnail, category, path, size, format)
+    if not located:
+        return web.Response(status=404)
+    full_path, stat, key = located
+
+    # The cache key already covers path, size, mtime, variant and format, so it is a strong validator.
+    # URLs carrying the source's current version (`v`, the listed mtime) can be cached for good; a stale one can't.
+    try:
+        versioned = float(request.query.get("v", "nan")) == stat.st_mtime_ns / 1e9
+    except ValueError:
+        versioned = False
+    headers = {
+        'ETag': f'"{key}"',
+        'Last-Modified': formatdate(stat.st_mtime, usegmt=True),
+        'Cache-Control': THUMBNAIL_CACHE_CONTROL_VERSIONED if versioned else THUMBNAIL_CACHE_CONTROL,
+        'Vary': 'Accept',
+    }
+    if headers['ETag'] in request.headers.get('If-None-Match', ''):
+        return web.Response(status=304, headers=headers)
+
+    compressed_bytes = await load_thumbnail(full_path, key, size, format)
+    if compressed_bytes is None:
+        # A failed render may be transient, so nothing about it may be cached
+        return web.Response(text=f"Unable to create a thumbnail for '{path}'", status=500, headers={'Cache-Control': 'no-store'})
+    response = web.StreamResponse(headers=headers)
+    response.content_type = THUMBNAIL_FORMATS[format][1]
     response.content_length = len(compressed_bytes)
     await response.prepare(request)
     await response.write(compressed_bytes)
@@ -565,27 +2953,170 @@ async def get_image(request):
 
     return response
     
+# GET IMAGE THUMBNAILS IN BATCHES
+async def get_images(request):
+    try:
+        body = await request.json()
+    except ValueError:
+        return web.Response(text="Request body must be JSON", status=400)
+    if not isinstance(body, dict):
+        return web.Response(text="Request body must be a JSON object", status=400)
+    category = body.get("category")
+    paths = body.get("paths")
+    size = body.get("size", "grid")
+    if not category or not isinstance(paths, list):
+        return web.Response(text="Missing 'category' or 'paths'", status=400)
+    if len(paths) > GALLERY_BATCH_LIMIT:
+        return web.Response(text=f"At most {GALLERY_BATCH_LIMIT} paths can be requested at once", status=400)
+    if size not in THUMBNAIL_SIZES:
+        return web.Response(text=f"Unknown thumbnail size '{size}'", status=400)
+    format = negotiate_thumbnail_format(request.headers.get('Accept'), body.get("format"))
+    content_type = THUMBNAIL_FORMATS[format][1]
+
+    def locate_all():
+        return [locate_thumbnail(category, str(path), size, format) for path in paths]
+
+    async def load(index, path, located):
+        if not located:
+            return index, path, None
+        full_path, _, key = located
+        return index, path, await load_thumbnail(full_path, key, size, format)
+
+    # Every source is stat'ed in one trip to the executor rather than one per path
+    located = await asyncio.get_running_loop().run_in_executor(None, locate_all)
+
+    # One multipart/form-data stream, parts written as soon as each thumbnail is ready.
+    # Batches are POSTs, which browsers never cache: a hundred paths don't fit a GET request line, and a multipart body
+    # has no single version to validate. Large folders trade browser caching for one request per hundred thumbnails;
+    # revisits are still served from the memory and disk tiers without rendering. Folders of up to
+    # GALLERY_BATCH_THRESHOLD images use get_image, where ETag and versioned URLs apply.
+    boundary = 'nd' + os.urandom(12).hex()
+    response = web.StreamResponse(headers={
+        'Content-Type': f'multipart/form-data; boundary={boundary}',
+        'Cache-Control': 'no-store',
+    })
+    await response.prepare(request)
+    tasks = [asyncio.ensure_future(load(index, str(path), entry)) for index, (path, entry) in enumerate(zip(paths, located))]
+    try:
+        for completed in asyncio.as_completed(tasks):
+            index, path, data = await completed
+            if not data:
+                continue
+            filename = urllib.parse.quote(os.path.basename(path))
+            await response.write((
+                f'--{boundary}\r\n'
+                f'Content-Disposition: form-data; name="{index}"; filename="{filename}"\r\n'
+                f'Content-Type: {content_type}\r\n\r\n'
+            ).encode('utf-8') + data + b'\r\n')
+        await response.write(f'--{boundary}--\r\n'.encode('utf-8'))
+        await response.write_eof()
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    return response
+
+# GET CACHE STATS
+async def get_cache_stats(request):
+    stats = {
+        "disk": {
+            "entries": len(THUMBNAIL_CACHE.entries),
+            "bytes": THUMBNAIL_CACHE.total_bytes,
+            "max_entries": THUMBNAIL_CACHE.max_entries,
+            "max_bytes": THUMBNAIL_CACHE.max_bytes,
+        },
+        "memory": THUMBNAIL_MEMORY.stats(),
+        "listing": LISTING_CACHE.stats(),
+        "prefetch": {
+            "queued": len(THUMBNAIL_PREFETCH.queued),
+            "inflight": len(THUMBNAIL_INFLIGHT),
+        },
+        "warm": THUMBNAIL_PREFETCH.warm,
+    }
+    return web.Response(text=json.dumps(stats), content_type='application/json')
+
+# GET GALLERY STATS
+async def get_gallery_stats(request):
+    stats = await asyncio.get_running_loop().run_in_executor(None, CATALOG.stats)
+    stats["watcher"] = GALLERY_WATCHER.stats()
+    return web.Response(text=json.dumps(stats), content_type='application/json')
+
 # SEARCH IMAGES
 async def search_images(request):
-    def search_image_paths(search_query):
-        results = {"images": []}
-
-        for path in IMAGE_PATHS:
-            if os.path.isdir(path):
-                for root, _, files in os.walk(path):
-                    for file in files:
-                        file_path = os.path.join(root, file)
-                        if is_valid_image(file_path):
-                            matched_objects = search_query_in_filename(file, search_query) or search_query_in_workflow(file_path, search_query)
-                            if matched_objects:
-                                result = {
-                                    "category": os.path.basename(path),
-                                    "path": os.path.relpath(file_path, path),
-                                    "matched": matched_objects[1][1] if len(matched_objects) > 1 and len(matched_objects[1]) > 1 else matched_objects,
-                                }
-                                results["images"].append(result)
+    def scan_folder(category, base, relative):
+        subfolders = []
+        names = []
+        prefix = relative + '/' if relative else ''
+        try:
+            with os.scandir(os.path.join(base, relative)) as entries:
+                for entry in entries:
+                    if cancelled.is_set():
+                        break
+                    if entry.is_dir():
+                        if not entry.is_symlink():
+                            subfolders.append(prefix + entry.name)
+                    elif is_valid_image(entry.name):
+                        names.append(entry.name)
+        except OSError:
+            pass
+        return "folder", (category, base, relative, subfolders, names)
+
+    def search_files(category, base, relative, names):
+        results = []
+        prefix = relative + '/' if relative else ''
+        for name in names:
+            if cancelled.is_set():
+                break
+            if filters:
+                matched_objects = search_filters_in_file(os.path.join(base, relative, name), name)
+            else:
+                matched_objects = search_query_in_filename(name, query) or search_query_in_workflow(os.path.join(base, relative, name), query)
+            if matched_objects:
+                results.append(search_result(category, prefix + name, matched_objects))
+        return "results", results
 
-        return results
+    def search_filters_in_file(file_path, name):
+        try:
+            metadata = read_file_metadata(file_path)
+        except Exception:
+            return []
+        text = metadata[2] if metadata else {}
+        node_types, rows, prompts = extract_image_inputs(text.get('workflow'), text.get('prompt'), validator)
+        prompts = "\n".join(prompts).lower()
+        if not all(term.rstrip('*').lower() in name.lower() or term.rstrip('*').lower() in prompts for term in terms):
+            return []
+        if not all(search_filter_matches(search_filter, node_types, rows) for search_filter in filters):
+            return []
+        return [{"node": row[0], "input": row[1], "value": row[2]} for row in sorted(rows) if row[1].lower() in filter_inputs] or filter_nodes
+
+    def search_input_rows(rows):
+        results = []
+        matched = CATALOG.matched_inputs([row[4] for row in rows], sorted(filter_inputs))
+        for _, category, folder, name, workflow in rows:
+            results.append(search_result(category, folder + '/' + name if folder else name, matched.get(workflow) or filter_nodes))
+        return "results", results
+
+    def search_rows(rows):
+        results = []
+        workflows = CATALOG.workflows([row[4] for row in rows if row[4] not in workflow_matches])
+        for _, category, folder, name, workflow in rows:
+            if cancelled.is_set():
+                break
+            matched_objects = search_query_in_filename(name, query)
+            if not matched_objects and workflow is not None:
+                if workflow not in workflow_matches:
+                    workflow_matches[workflow] = search_query_in_workflow_text(workflows.get(workflow), query)
+                matched_objects = workflow_matches[workflow]
+            if matched_objects:
+                results.append(search_result(category, folder + '/' + name if folder else name, matched_objects))
+        return "results", results
+
+    def search_result(category, path, matched_objects):
+        return {
+            "category": category,
+            "path": path,
+            "matched": matched_objects[1][1] if len(matched_objects) > 1 and isinstance(matched_objects[1], tuple) and len(matched_objects[1]) > 1 else matched_objects,
+        }
 
     def is_valid_image(file_path):
         _, extension = os.path.splitext(file_path)
@@ -599,10 +3130,15 @@ async def search_images(request):
         return matched_objects
 
     def search_query_in_workflow(file_path, search_query):
+        try:
+            metadata = read_file_metadata(file_path, ("workflow",))
+        except Exception:
+            return []
+        return search_query_in_workflow_text(metadata[2].get("workflow") if metadata else None, search_query)
+
+    def search_query_in_workflow_text(workflow, search_query):
         matched_objects = []
         try:
-            image = Image.open(file_path)
-            workflow = image.text.get("workflow")
             if workflow:
                 json_obj = json.loads(workflow)
                 matched_objects = is_search_query_match(json_obj, search_query, [])
@@ -634,13 +3170,91 @@ async def search_images(request):
 
     query = request.query.get("query")
     query = urllib.parse.unquote(query) if query else None
-    
-    result = {"images": []}
-    
-    if query:
-        result = search_image_paths(query)
+    try:
+        limit = max(0, int(request.query.get("limit", 0)))
+    except ValueError:
+        return web.Response(text="Query parameter 'limit' must be an integer", status=400)
+
+    # Matches are streamed as NDJSON, one image per line, as soon as each chunk of work finishes
+    response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson", "Cache-Control": "no-cache"})
+    await response.prepare(request)
+    if not query:
+        await response.write_eof()
+        return response
+
+    loop = asyncio.get_running_loop()
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=SEARCH_WORKERS, thread_name_prefix='search')
+    cancelled = threading.Event()
+    pending = set()
+    count = 0
 
-    return web.Response(text=json.dumps(result), content_type='application/json')
+    def submit(function, *args):
+        pending.add(loop.run_in_executor(executor, function, *args))
+
+    # Images sharing a stored workflow share its matches, so each distinct workflow is parsed once per search
+    workflow_matches = {}
+    validator = None
+    try:
+        # The dictionary's input names decide which key:value tokens are filters, the same way with or without the catalog
+        if ':' in query:
+            try:
+                validator = await loop.run_in_executor(executor, VALIDATOR_CACHE.get)
+            except (OSError, ValueError):
+                pass
+        # key:value filters such as node:KSampler or ckpt:sdxl_base match extracted node inputs instead of raw text
+        filters, terms = parse_search_query(query, validator.input_names if validator else ())
+        filter_inputs = {name.lower() for names, _, _ in filters if names for name in names}
+        filter_nodes = [{"node": value} for names, value, _ in filters if names is None]
+
+        if CATALOG and CATALOG.ready and filters:
+            rows = await loop.run_in_executor(executor, CATALOG.search_inputs, filters, terms)
+            for index in range(0, len(rows), SEARCH_CHUNK):
+                submit(search_input_rows, rows[index:index + SEARCH_CHUNK])
+        elif CATALOG and CATALOG.ready:
+            # Ranked prompt matches go out first; the raw text search only adds what the prompt index missed
+            prompt_rows = await loop.run_in_executor(executor, CATALOG.search_prompts, terms)
+            results = [search_result(category, folder + '/' + name if folder else name, [{"prompt": snippet}])
+                for _, category, folder, name, snippet in prompt_rows[:limit or None]]
+            if results:
+                await response.write("".join(json.dumps(result) + "\n" for result in results).encode('utf-8'))
+                count += len(results)
+            seen = {row[0] for row in prompt_rows}
+            rows = [row for row in await loop.run_in_executor(executor, CATALOG.search, query) if row[0] not in seen]
+            for index in range(0, len(rows), SEARCH_CHUNK):
+                submit(search_rows, rows[index:index + SEARCH_CHUNK])
+        else:
+            for base in IMAGE_PATHS:
+                if os.path.isdir(base):
+                    submit(scan_folder, os.path.basename(base), base, '')
+
+        while pending and not (limit and count >= limit):
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            pending -= done
+            for future in done:
+                kind, value = future.result()
+                if kind == "folder":
+                    category, base, relative, subfolders, names = value
+                    for subfolder in subfolders:
+                        submit(scan_folder, category, base, subfolder)
+                    for index in range(0, len(names), SEARCH_CHUNK):
+                        submit(search_files, category, base, relative, names[index:index + SEARCH_CHUNK])
+                    continue
+                results = value[:limit - count] if limit else value
+                if results:
+                    await response.write("".join(json.dumps(result) + "\n" for result in results).encode('utf-8'))
+                    count += len(results)
+            # Stop early when the browser has gone away, instead of searching for nobody
+            if request.transport is None or request.transport.is_closing():
+                return response
+        await response.write_eof()
+    except ConnectionResetError:
+        pass
+    finally:
+        cancelled.set()
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=False, cancel_futures=True)
+    return response
     
 # DELETE IMAGE
 last_image = ()
@@ -660,6 +3274,8 @@ async def delete_image(request):
 
     try:
         os.remove(full_path)
+        evict_thumbnails(full_path)
+        CATALOG.request(category, gallery_relative_path(path).rpartition('/')[0])
         cstr(f"Successfully deleted file: {full_path}").msg.print()
         return web.Response(text=json.dumps({"success":True}), content_type='application/json')
     except FileNotFoundError:
@@ -678,9 +3294,27 @@ async def get_workflow(request):
     category = urllib.parse.unquote(category) if category else None
     path = urllib.parse.unquote(path) if path else None
     full_path = get_full_path(category, path)
-    image = Image.open(full_path)
-    workflow = image.text['workflow'] if image.text['workflow'] else {}
-    return web.Response(text=json.dumps(workflow, indent=4), content_type='application/json')
+    if not full_path:
+        return web.Response(text=f"No workflow found in '{path}'", status=404)
+    # The catalog's copy is served as stored while the file is unchanged since indexing
+    def read():
+        try:
+            stat = os.stat(full_path)
+        except OSError:
+            return None
+        row = CATALOG.image_workflow(category, gallery_relative_path(path)) if CATALOG and CATALOG.ready else None
+        if row and row[:2] == (stat.st_size, stat.st_mtime_ns):
+            return row[2]
+        try:
+            metadata = read_file_metadata(full_path, ("workflow",))
+        except (OSError, ValueError, struct.error):
+            return None
+        return metadata[2].get('workflow') if metadata else None
+
+    workflow = await asyncio.get_running_loop().run_in_executor(None, read)
+    if workflow is None:
+        return web.Response(text=f"No workflow found in '{path}'", status=404)
+    return web.Response(text=workflow, content_type='application/json')
         
     
 # GET FAV ICON SVG
@@ -692,6 +3326,22 @@ async def get_fav_icon(request):
 async def index(request):
     return web.Response(text=HTML, content_type='text/html')
     
+async def on_startup(app):
+    THUMBNAIL_PREFETCH.start()
+    if not NO_GALLERY:
+        CATALOG.start()
+        if WATCH_MODE != "off":
+            GALLERY_WATCHER.start()
+    if THUMBNAIL_WARM_COUNT:
+        asyncio.ensure_future(THUMBNAIL_PREFETCH.warm_cache(THUMBNAIL_WARM_COUNT))
+
+async def on_cleanup(app):
+    THUMBNAIL_PREFETCH.stop()
+    CATALOG.stop()
+    GALLERY_WATCHER.stop()
+    THUMBNAIL_WORKERS_POOL.shutdown()
+    THUMBNAIL_CACHE.save()
+    
 
 if __name__ == "__main__":
 
@@ -742,9 +3392,21 @@ if __name__ == "__main__":
     parser.add_argument("--no-source-code", action="store_true", help="Don't scrape, store, or display source code from node classes.")
     parser.add_argument("--offline", action="store_true", help="Do not use online functionality.")
     parser.add_argument("--purge-cache", action="store_true", help="Delete the image gallery cache on startup.")
+    parser.add_argument("--cache-size", type=int, help="Maximum size of the image gallery cache in megabytes.")
+    parser.add_argument("--cache-entries", type=int, help="Maximum number of thumbnails kept in the image gallery cache.")
+    parser.add_argument("--memory-cache", type=int, help="Megabytes of recently viewed thumbnails kept in memory. 0 disables the memory cache.")
+    parser.add_argument("--thumbnail-workers", type=int, help="Number of processes used to render gallery thumbnails. Defaults to the number of CPU cores.")
+    parser.add_argument("--thumbnail-avif", action="store_true", help="Serve AVIF thumbnails to browsers that accept them.")
+    parser.add_argument("--warm-cache", type=int, metavar="N", help="Render thumbnails for the N most recent gallery images in the background on startup.")
+    parser.add_argument("--prefetch-subfolders", type=int, help="Number of most recent subfolders to pre-generate thumbnails for when a gallery folder is opened.")
+    parser.add_argument("--catalog-interval", type=float, help="Minutes between full rescans of the image catalog. 0 only scans on startup.")
+    parser.add_argument("--watch", choices=["auto", "poll", "off"], help="How gallery folders are watched for new, deleted and renamed images. auto uses inotify where available and polls otherwise.")
     parser.add_argument("--update-classes", action="store_true", help="Update the database for any changes to node classes.")
     parser.add_argument("--update-plist", action="store_true", help="Download a new version of the ComfyUI Manger plugin list.")
+    parser.add_argument("--plist-interval", type=float, help="Hours between background refreshes of the ComfyUI Manager plugin list. 0 only refreshes on startup.")
     parser.add_argument('--image-paths', type=split_paths)
+    parser.add_argument("--benchmark-metadata", nargs='+', metavar="PATH", help="Time reading workflow metadata from PNG files or folders with Pillow and with the chunk reader, then exit.")
+    parser.add_argument("--validate", nargs='+', metavar="PATH", help="Validate workflow JSON files, images or folders against the dictionary and exit.")
     args = parser.parse_args()
 
     if args.no_source_code:
@@ -773,11 +3435,50 @@ if __name__ == "__main__":
             IMAGE_PATHS.append(_)
     if args.purge_cache:
         PURGE_CACHE = True
-            
+    if args.cache_size:
+        THUMBNAIL_CACHE_MAX_BYTES = args.cache_size * 1024 * 1024
+    if args.cache_entries:
+        THUMBNAIL_CACHE_MAX_ENTRIES = args.cache_entries
+    if args.memory_cache is not None:
+        THUMBNAIL_MEMORY_MB = max(0, args.memory_cache)
+    if args.thumbnail_avif:
+        THUMBNAIL_AVIF = True
+    if args.thumbnail_workers:
+        THUMBNAIL_WORKERS = args.thumbnail_workers
+    if args.warm_cache:
+        THUMBNAIL_WARM_COUNT = max(0, args.warm_cache)
+    if args.prefetch_subfolders is not None:
+        THUMBNAIL_PREFETCH_SUBFOLDERS = max(0, args.prefetch_subfolders)
+    if args.watch:
+        WATCH_MODE = args.watch
+    if args.catalog_interval is not None:
+        CATALOG_INTERVAL = max(0, int(args.catalog_interval * 60))
+    if args.plist_interval is not None:
+        PLIST_INTERVAL = max(0, int(args.plist_interval * 3600))
+            
+    # REFRESH PLUGIN LIST
+    if not NO_PLIST:
+        if IS_ONLINE:
+            PLIST_REFRESHER = PlistRefresher([(PLIST, PFILE), (NODE_MAP, NODE_MAP_FILE)], interval=PLIST_INTERVAL, force=UPDATE_PLIST)
+            PLIST_REFRESHER.start()
+        elif not os.path.exists(PFILE):
+            cstr("Unable to download ComfyUI Manager plugin list while offline.").error.print()
+        if os.path.exists(PFILE):
+            threading.Thread(target=NODE_INDEX_CACHE.get if os.path.exists(DB_FILE) else PLUGIN_INDEX_CACHE.get, name='node-index', daemon=True).start()
+
     # HANDLE TEMP PATH
     if os.path.exists(THUMBNAIL_DIRECTORY) and PURGE_CACHE:
         shutil.rmtree(THUMBNAIL_DIRECTORY)
     os.makedirs(THUMBNAIL_DIRECTORY, exist_ok=True)
+    THUMBNAIL_CACHE = ThumbnailCache(THUMBNAIL_DIRECTORY, THUMBNAIL_CACHE_MAX_BYTES, THUMBNAIL_CACHE_MAX_ENTRIES)
+    THUMBNAIL_MEMORY = MemoryCache(THUMBNAIL_MEMORY_MB * 1024 * 1024)
+    THUMBNAIL_STATS = StatCache(THUMBNAIL_STAT_TTL)
+    threading.Thread(target=THUMBNAIL_CACHE.prune, name='thumbnail-prune', daemon=True).start()
+    THUMBNAIL_WORKERS_POOL = ThumbnailWorkers(THUMBNAIL_WORKERS)
+    THUMBNAIL_PREFETCH = ThumbnailPrefetcher(max(1, THUMBNAIL_WORKERS // 2))
+    CATALOG = ImageCatalog(CATALOG_FILE, CATALOG_INTERVAL)
+    CATALOG.on_change = invalidate_gallery_folder
+    GALLERY_WATCHER = GalleryWatcher(CATALOG, WATCH_MODE)
     
     if 'Pygments' not in packages() and not NO_PYGMENTS:
         if IS_ONLINE:
@@ -792,6 +3493,23 @@ if __name__ == "__main__":
         from pygments.lexers import PythonLexer
         from pygments.formatters import HtmlFormatter
         
+    # BENCHMARK METADATA READING AND EXIT
+    if args.benchmark_metadata:
+        sys.exit(1 if benchmark_metadata(args.benchmark_metadata) else 0)
+    # VALIDATE WORKFLOWS AND EXIT
+    if args.validate:
+        build_dictionary()
+        report = validate_workflow_paths(VALIDATOR_CACHE.get(), args.validate)
+        for result in report["results"]:
+            if result["valid"]:
+                continue
+            cstr(f"{result['name']}").warning.print()
+            for error in result["errors"]:
+                print(f"\t{error.get('issue')}: node {error.get('node')} ({error.get('type')}) {error.get('input') or ''} {json.dumps(error.get('value')) if 'value' in error else ''}{' expected ' + str(error['expected']) if error.get('expected') else ''}")
+        summary = report["summary"]
+        cstr(f"Validated {summary['workflows']} workflows: {summary['invalid']} invalid, {summary['errors']} errors.").msg.print()
+        sys.exit(1 if summary['invalid'] else 0)
+
     # Define the ComfyUI Dictionary Webpage
     HTML = '''
     <!DOCTYPE html>
@@ -1284,6 +4002,7 @@ if __name__ == "__main__":
             
             .custom-node-title a:hover { color: var(--menu-color); }
             .custom-node-title a { text-decoration: none; font-weight: bold; }
+            .custom-node-installed { float: right; font-size: 12px; color: var(--menu-color); }
             .custom-node-content { border-top: 1px solid rgba(255,255,255,0.25); }
             .custom-node-description { padding: 10px; padding: 5px 10px 10px 10px; }
                     
@@ -1348,6 +4067,17 @@ if __name__ == "__main__":
             }
             
             #button-container button:hover { border-color: var(--clip); }
+
+            #gallery-sort {
+                padding: 5px;
+                border-radius: 5px;
+                font-size: 15px;
+                color: var(--content-text-color);
+                background-color: var(--gen-title);
+                border: 1px solid var(--bg-color);
+            }
+
+            #gallery-load-more { cursor: pointer; }
             
             #home-button {
                 background-color: var(--cat-color) !important;
@@ -1910,6 +4640,9 @@ if __name__ == "__main__":
                 homeButton,
                 backButton,
                 galSearchInput,
+                batchedImageUrls = [],
+                gallerySortSelect,
+                searchController,
                 matched = [];
             
             const tooltips = {
@@ -2265,7 +4998,7 @@ if __name__ == "__main__":
                 });
             }
             
-            function displayNodeMangerList(data) {
+            function displayNodeMangerList(data, installed = {}) {
                 if (Array.isArray(data.custom_nodes) && data.custom_nodes.length > 0) {
                     let html = '';
 
@@ -2275,10 +5008,11 @@ if __name__ == "__main__":
                         } else {
                             var description = node.description;
                         }
+                        var installedHtml = installed[node.reference] ? `<span class="custom-node-installed" title="Installed as ${installed[node.reference]}">Installed</span>` : '';
                         const nodeHtml = `
                             <div class="custom-node">
                                 <div class="custom-node-title">
-                                    <a href="${node.reference}" title="${node.title} by ${node.author}" target="_blank">${node.title}</a>
+                                    <a href="${node.reference}" title="${node.title} by ${node.author}" target="_blank">${node.title}</a>${installedHtml}
                                 </div>
                                 <div class="custom-node-content">
                                     <p class="custom-node-description">${description}</p>
@@ -2324,10 +5058,12 @@ if __name__ == "__main__":
 
                 classInfoDiv.innerHTML = html;
 
-                fetch(address + '/plugins')
-                    .then(response => response.json())
-                    .then(data => {
-                        displayNodeMangerList(data);
+                Promise.all([
+                    fetch(address + '/plugins').then(response => response.json()),
+                    fetch(address + '/plugins/installed').then(response => response.json())
+                ])
+                    .then(([data, index]) => {
+                        displayNodeMangerList(data, index.installed);
                     })
                     .catch(error => console.error(error));
             }
@@ -2572,6 +5308,12 @@ if __name__ == "__main__":
                                 <div id="button-container">
                                     <button id="home-button" disabled>Home</button>
                                     <button id="back-button" disabled>Back</button>
+                                    <select id="gallery-sort">
+                                        <option value="name-asc" selected>Name</option>
+                                        <option value="mtime-desc">Newest</option>
+                                        <option value="mtime-asc">Oldest</option>
+                                        <option value="size-desc">Largest</option>
+                                    </select>
                                     <div class="image-gallery-search"><input id="image-gallery-search-input" type="text" placeholder="Search by filename or workflow" /></div>
                                 </div>
                                 <div id="gen-gallery-container" class="gen-gallery-container"></div>
@@ -2604,6 +5346,12 @@ if __name__ == "__main__":
                     loadImageGallery(selectedCategory, '/');
                 });
 
+                gallerySortSelect = document.getElementById('gallery-sort');
+                gallerySortSelect.addEventListener('change', function () {
+                    if (selectedPath !== '/nd-search-results')
+                        loadImageGallery(selectedCategory, selectedPath);
+                });
+
                 homeButton = document.getElementById('home-button');
                 backButton = document.getElementById('back-button');
                 galSearchInput = document.getElementById('image-gallery-search-input');
@@ -2625,50 +5373,81 @@ if __name__ == "__main__":
             }
             
             function searchImages(query) {
-                var url = '/search_images?query=' + encodeURIComponent(query);
+                var url = '/search_images?query=' + encodeURIComponent(query) + '&limit=' + ''' + str(GALLERY_SEARCH_LIMIT) + ''',
+                    controller = new AbortController();
                 galleryContainer = document.getElementById('gen-gallery-container');
                 
+                abortSearch();
+                searchController = controller;
+                revokeBatchedImages();
                 galleryContainer.innerHTML = '<i class="loading">Searching images...</i>';
-                
-                fetch(url)
-                    .then(response => response.json())
-                    .then(data => {
-                        console.log(data);
-                        displaySearchResults(data);
+                matched = [];
+                selectedPath = "/nd-search-results";
+                updateButtonStates();
+                backButton.disabled = true;
+
+                // Results arrive as NDJSON, one image per line, and are shown as they come in
+                fetch(url, { signal: controller.signal })
+                    .then(response => {
+                        var reader = response.body.getReader(),
+                            decoder = new TextDecoder(),
+                            buffer = '';
+
+                        function read() {
+                            return reader.read().then(({ done, value }) => {
+                                buffer += decoder.decode(value || new Uint8Array(), { stream: !done });
+                                var lines = buffer.split('\\n');
+                                buffer = lines.pop();
+                                displaySearchResults(lines.filter(line => line.trim() !== '').map(line => JSON.parse(line)));
+                                if (!done)
+                                    return read();
+                                var loading = galleryContainer.querySelector('.loading');
+                                if (loading)
+                                    loading.remove();
+                                if (matched.length === 0)
+                                    galleryContainer.innerHTML = '<i>No matches found.</i>';
+                                if (searchController === controller)
+                                    searchController = null;
+                            });
+                        }
+
+                        return read();
                     })
-                    .catch(error => console.error(error));
+                    .catch(error => {
+                        if (error.name !== 'AbortError')
+                            console.error(error);
+                    });
             }
-            
-            function displaySearchResults(searchResults) {
-                var images = searchResults.images,
-                    imagesHtml = '';
-                galleryContainer = document.getElementById('gen-gallery-container');
-                matched = []
-                backButton.disabled = true;
 
-                if ( images.length > 0 ) {
-                    for (var i = 0; i < images.length; i++) {
-                        var match = ( images[i].matched ? images[i].matched : 'none' );
-                        matched.push(match);
-                        imagesHtml += '<div id="image-container-' + i + '" class="gallery-image-container">';
-                        imagesHtml += '<img id="gen-image-' + i + '" class="gen-image-link" data-category="' + images[i].category + '" data-path="' + images[i].path + '" data-matched="' + i + '" src="/get_image?category=' + images[i].category + '&path=' + images[i].path + '" alt="' + images[i].path.split("/").pop() + '">';
-                        imagesHtml += '<div class="gen-gallery-image-title" title="' + images[i].path.split("/").pop() + '">' + images[i].path.split("/").pop() + '</div>';
-                        imagesHtml += '</div>';
-                    }
-                } else {
-                    imagesHtml += '<i>No matches found.</i>';
+            function abortSearch() {
+                if (searchController) {
+                    searchController.abort();
+                    searchController = null;
+                }
+            }
+            
+            function displaySearchResults(images) {
+                var imagesHtml = '',
+                    start = matched.length;
+
+                for (var i = 0; i < images.length; i++) {
+                    var index = start + i,
+                        match = ( images[i].matched ? images[i].matched : 'none' );
+                    matched.push(match);
+                    imagesHtml += '<div id="image-container-' + index + '" class="gallery-image-container">';
+                    imagesHtml += '<img id="gen-image-' + index + '" class="gen-image-link" data-category="' + images[i].category + '" data-path="' + images[i].path + '" data-matched="' + index + '" src="/get_image?category=' + images[i].category + '&path=' + images[i].path + '" alt="' + images[i].path.split("/").pop() + '">';
+                    imagesHtml += '<div class="gen-gallery-image-title" title="' + images[i].path.split("/").pop() + '">' + images[i].path.split("/").pop() + '</div>';
+                    imagesHtml += '</div>';
                 }
 
-                galleryContainer.innerHTML = imagesHtml;
+                if (imagesHtml === '')
+                    return;
+                galleryContainer.insertAdjacentHTML('beforeend', imagesHtml);
 
-                var imgElements = galleryContainer.getElementsByClassName('gen-image-link');
+                var imgElements = Array.from(galleryContainer.getElementsByClassName('gen-image-link')).slice(start);
                 for (var i = 0; i < imgElements.length; i++) {
                     imgElements[i].addEventListener('click', handleImageModal);
                 }
-                
-                selectedPath = "/nd-search-results";
-
-                updateButtonStates();
             }
                         
             function deleteImage(category, path) {
@@ -2733,7 +5512,7 @@ if __name__ == "__main__":
                 confirmButton.removeEventListener("click", confirmButtonClickHandler);
                 abortButton.removeEventListener("click", abortButtonClickHandler);
                 
-                modalImage.src = category + '/' + path;
+                modalImage.src = path.toLowerCase().endsWith('.gif') ? category + '/' + path : '/get_image?category=' + encodeURIComponent(category) + '&path=' + encodeURIComponent(path) + '&size=modal';
                 modalLink.href = category + '/' + path;
                 imageModal.style.display = 'block';
                 if (matchedId) {
@@ -2783,7 +5562,7 @@ if __name__ == "__main__":
                     return fetch(url)
                         .then(response => {
                             if (response.ok) {
-                                return response.json();
+                                return response.text();
                             }
                             throw new Error("Could not retrieve workflow from: "+path);
                         })
@@ -2818,16 +5597,21 @@ if __name__ == "__main__":
                 fadeIn(imageModal, 0.2);
             }
             
-            function loadImageGallery(category, path, previousPath) {
-                var url = '/get_paths?category=' + encodeURIComponent(category) + '&path=' + encodeURIComponent(path);
+            function loadImageGallery(category, path, previousPath, offset=0) {
+                if (offset === 0)
+                    abortSearch();
+                var sort = gallerySortSelect.value.split('-'),
+                    url = '/get_paths?category=' + encodeURIComponent(category) + '&path=' + encodeURIComponent(path)
+                        + '&sort=' + sort[0] + '&order=' + sort[1] + '&offset=' + offset + '&limit=' + ''' + str(GALLERY_PAGE_SIZE) + ''';
 
                 fetch(url)
                     .then(response => response.json())
                     .then(data => {
-                        var json = JSON.parse(data);
+                        if (offset > 0 && path !== selectedPath)
+                            return;
 
-                        var directories = json.directories;
-                        var images = json.images;
+                        var directories = data.directories;
+                        var images = data.images;
                         selectedPath = path;
 
                         var directoriesHtml = '';
@@ -2837,30 +5621,96 @@ if __name__ == "__main__":
                                 directoriesHtml += '<div class="gen-gal-sep"></div>';
                         }
 
-                        var imagesHtml = '';
+                        var imagesHtml = '',
+                            batched = images.length > ''' + str(GALLERY_BATCH_THRESHOLD) + ''';
                         for (var i = 0; i < images.length; i++) {
-                            imagesHtml += '<div id="image-container-' + i + '" class="gallery-image-container">';
-                            imagesHtml += '<img id="gen-image-' + i + '" class="gen-image-link" data-category="' + category + '" data-path="' + images[i] + '" src="/get_image?category=' + category + '&path=' + images[i] + '" alt="' + images[i].split("/").pop() + '"><div class="gen-gallery-image-title" title="' + images[i].split("/").pop() + '">' + images[i].split("/").pop() + '</div>';
+                            var index = offset + i,
+                                imagePath = images[i].path,
+                                imageName = imagePath.split("/").pop(),
+                                imageSrc = batched ? '' : ' src="/get_image?category=' + category + '&path=' + imagePath + '&v=' + images[i].mtime + '"';
+                            imagesHtml += '<div id="image-container-' + index + '" class="gallery-image-container">';
+                            imagesHtml += '<img id="gen-image-' + index + '" class="gen-image-link" data-category="' + category + '" data-path="' + imagePath + '"' + imageSrc + ' alt="' + imageName + '"><div class="gen-gallery-image-title" title="' + imageName + '">' + imageName + '</div>';
                             imagesHtml += '</div>';
                         }
 
-                        galleryContainer.innerHTML = directoriesHtml + imagesHtml;
+                        var loadMore = document.getElementById('gallery-load-more');
+                        if (loadMore)
+                            loadMore.remove();
+                        if (offset === 0) {
+                            revokeBatchedImages();
+                            galleryContainer.innerHTML = directoriesHtml + imagesHtml;
+                        } else {
+                            galleryContainer.insertAdjacentHTML('beforeend', imagesHtml);
+                        }
 
-                        var directoryElements = galleryContainer.getElementsByClassName('directory');
-                        for (var i = 0; i < directoryElements.length; i++) {
-                            directoryElements[i].addEventListener('click', handleDirectoryClick);
+                        var imgElements = Array.from(galleryContainer.getElementsByClassName('gen-image-link')).slice(offset);
+                        if (batched) {
+                            loadBatchedImages(category, imgElements);
+                        }
+
+                        if (offset === 0) {
+                            var directoryElements = galleryContainer.getElementsByClassName('directory');
+                            for (var i = 0; i < directoryElements.length; i++) {
+                                directoryElements[i].addEventListener('click', handleDirectoryClick);
+                            }
                         }
 
-                        var imgElements = galleryContainer.getElementsByClassName('gen-image-link');
                         for (var i = 0; i < imgElements.length; i++) {
                             imgElements[i].addEventListener('click', handleImageModal);
                         }
 
+                        var loaded = offset + images.length;
+                        if (loaded < data.total) {
+                            galleryContainer.insertAdjacentHTML('beforeend', '<div id="gallery-load-more" class="directory">Load more (' + (data.total - loaded) + ' remaining)</div>');
+                            document.getElementById('gallery-load-more').addEventListener('click', function () {
+                                loadImageGallery(category, path, previousPath, loaded);
+                            });
+                        }
+
                         updateButtonStates();
                     })
                     .catch(error => console.error(error));
             }
 
+            // Large folders fetch their thumbnails as multipart batches instead of one request per image
+            function loadBatchedImages(category, imgElements) {
+                var batchSize = ''' + str(GALLERY_BATCH_SIZE) + ''',
+                    batches = [];
+                for (var i = 0; i < imgElements.length; i += batchSize) {
+                    batches.push(imgElements.slice(i, i + batchSize));
+                }
+
+                function next() {
+                    var batch = batches.shift();
+                    if (!batch)
+                        return Promise.resolve();
+                    return fetch('/get_images', {
+                        method: 'POST',
+                        headers: { 'Content-Type': 'application/json', 'Accept': 'image/webp,image/*' },
+                        body: JSON.stringify({ category: category, paths: batch.map(img => img.dataset.path) })
+                    })
+                        .then(response => response.formData())
+                        .then(formData => {
+                            formData.forEach((file, index) => {
+                                var img = batch[parseInt(index)];
+                                if (img && img.isConnected) {
+                                    img.src = URL.createObjectURL(file);
+                                    batchedImageUrls.push(img.src);
+                                }
+                            });
+                        })
+                        .catch(error => console.error(error))
+                        .then(next);
+                }
+
+                return Promise.all([next(), next()]);
+            }
+
+            function revokeBatchedImages() {
+                batchedImageUrls.forEach(url => URL.revokeObjectURL(url));
+                batchedImageUrls = [];
+            }
+
             function updateButtonStates(disable=false) {
                 if (selectedPath === '/' || disable === true) {
                     if ( homeButton.disabled !== true )
@@ -2941,9 +5791,17 @@ if __name__ == "__main__":
     cstr(f"Starting Node Dictionary Server with Domain: {DOMAIN},  Port:{PORT}").msg.print()
     middlewares = [create_cors_middleware('*'), log_request_middleware]
     app = web.Application(client_max_size=20971520, middlewares=middlewares)
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
     app.router.add_get('/classes', get_node_classes)
     app.router.add_get('/plugins', get_plugin_list)
+    app.router.add_get('/plugins/installed', get_installed_plugins)
+    app.router.add_post('/resolve_workflow', resolve_workflow)
+    app.router.add_post('/validate_workflows', validate_workflows)
     app.router.add_get('/get_image', get_image)
+    app.router.add_post('/get_images', get_images)
+    app.router.add_get('/cache_stats', get_cache_stats)
+    app.router.add_get('/gallery_stats', get_gallery_stats)
     app.router.add_get('/search_images', search_images)
     app.router.add_get('/get_paths', get_directory)
     app.router.add_get('/get_workflow', get_workflow)
@@ -0,0 +1,125 @@
+import http.server
+import importlib.util
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+
+SOURCE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'comfy_dictionary.py')
+LITEGRAPH_COLORS = ["NODE_DEFAULT_BOXCOLOR", "WIDGET_BGCOLOR", "NODE_DEFAULT_BGCOLOR", "NODE_SELECTED_TITLE_COLOR", "NODE_TEXT_COLOR",
+    "NODE_TITLE_COLOR", "WIDGET_SECONDARY_TEXT_COLOR", "DEFAULT_SHADOW_COLOR", "LINK_COLOR", "EVENT_LINK_COLOR", "CONNECTING_LINK_COLOR"]
+PLUGIN_LIST = {"custom_nodes": [{"title": "Example", "reference": "https://github.com/example/example"}]}
+ETAG = '"plugins-1"'
+
+
+def load_module(root):
+    # The script reads ComfyUI's color palette at import, so it is loaded from a stand-in ComfyUI root
+    palette_dir = os.path.join(root, 'web', 'extensions', 'core')
+    os.makedirs(palette_dir)
+    colors = {"node_slot": {"CLIP": "#fff"}, "comfy_base": {"fg-color": "#fff"}, "litegraph_base": {key: "#000" for key in LITEGRAPH_COLORS}}
+    with open(os.path.join(palette_dir, 'colorPalette.js'), 'w') as file:
+        file.write(f"const colorPalettes = {json.dumps({'dark': {'colors': colors}, 'light': {'colors': colors}})};\n")
+    path = os.path.join(root, 'comfy_dictionary.py')
+    shutil.copy(SOURCE, path)
+    spec = importlib.util.spec_from_file_location('comfy_dictionary_under_test', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class PluginListHandler(http.server.BaseHTTPRequestHandler):
+    requests = []
+
+    def do_GET(self):
+        self.requests.append((self.path, dict(self.headers)))
+        if self.path == '/invalid':
+            body = b'{"custom_nodes": ['
+        elif self.headers.get('If-None-Match') == ETAG:
+            self.send_response(304)
+            self.end_headers()
+            return
+        else:
+            body = json.dumps(PLUGIN_LIST).encode('utf-8')
+        self.send_response(200)
+        self.send_header('ETag', ETAG)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class FetchPlistTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.root = tempfile.mkdtemp()
+        cls.module = load_module(cls.root)
+        cls.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), PluginListHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.url = f'http://127.0.0.1:{cls.server.server_address[1]}'
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        shutil.rmtree(cls.root, ignore_errors=True)
+        sys.modules.pop('comfy_dictionary_under_test', None)
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp(dir=self.root)
+        self.path = os.path.join(self.folder, 'custom-node-list.json')
+        self.module.FETCH_META_FILE = os.path.join(self.folder, 'explorer_downloads.json')
+        PluginListHandler.requests = []
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def fetch(self, path='/custom-node-list.json', force=False):
+        return self.module.fetch_plist(self.url + path, self.path, force=force)
+
+    def test_download_writes_file_and_validators(self):
+        self.assertTrue(self.fetch())
+        with open(self.path, encoding='utf-8') as file:
+            self.assertEqual(json.load(file), PLUGIN_LIST)
+        stat = os.stat(self.path)
+        entry = self.module.load_fetch_meta()[self.url + '/custom-node-list.json']
+        self.assertEqual(entry["etag"], ETAG)
+        self.assertEqual((entry["size"], entry["mtime_ns"]), (stat.st_size, stat.st_mtime_ns))
+
+    def test_not_modified_keeps_file(self):
+        self.assertTrue(self.fetch())
+        stat = os.stat(self.path)
+        self.assertFalse(self.fetch())
+        self.assertEqual(PluginListHandler.requests[-1][1].get('If-None-Match'), ETAG)
+        self.assertEqual(os.stat(self.path).st_mtime_ns, stat.st_mtime_ns)
+
+    def test_local_edit_drops_validators(self):
+        self.assertTrue(self.fetch())
+        with open(self.path, 'w', encoding='utf-8') as file:
+            file.write('{}')
+        self.assertTrue(self.fetch())
+        self.assertNotIn('If-None-Match', PluginListHandler.requests[-1][1])
+        with open(self.path, encoding='utf-8') as file:
+            self.assertEqual(json.load(file), PLUGIN_LIST)
+
+    def test_force_skips_validators(self):
+        self.assertTrue(self.fetch())
+        self.assertTrue(self.fetch(force=True))
+        self.assertNotIn('If-None-Match', PluginListHandler.requests[-1][1])
+
+    def test_invalid_download_keeps_previous_file(self):
+        self.assertTrue(self.fetch())
+        with open(self.path, 'rb') as file:
+            previous = file.read()
+        self.assertFalse(self.fetch('/invalid'))
+        with open(self.path, 'rb') as file:
+            self.assertEqual(file.read(), previous)
+        self.assertEqual(sorted(os.listdir(self.folder)), ['custom-node-list.json', 'explorer_downloads.json'])
+
+
+if __name__ == '__main__':
+    unittest.main()